@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the runtime: ways to get a parsing table, and ways to recognize many sentences.
+
+$ python benchmarks.py import --size 200
+$ python benchmarks.py recognize --documents 100000
+$ python benchmarks.py table --size 1000 --jobs 4
+"""
+import argparse
+import importlib.util
+import os
+import py_compile
+import random
+import sys
+import tempfile
+import time
+
+from parser.emit import emit_module
+from parser.functions import parse_bnf
+from parser.generate import SentenceGenerator
+from parser.parallel import build_table
+from parser.passes import default_pipeline
+from parser.runtime import CompiledTable
+from parser.vectorized import VectorRecognizer
+
+COMMANDS = """
+Command -> Verb Args
+Verb -> get | set | del
+Args -> Arg Args | ε
+Arg -> name | Expr
+Expr -> ( Expr + Expr ) | number
+"""
+
+
+def synthetic_grammar(size):
+    """
+    LL(1) grammar, once left-recursion is removed, with about 3 * size nonterminals
+    """
+    lines = []
+    for i in range(size):
+        lines.append('S{0} -> a{0} S{1} | b{0} B{0} | E{0} ; | ε'.format(i, i + 1))
+        lines.append('B{0} -> c{0} d{0} | d{0}'.format(i))
+        lines.append('E{0} -> E{0} + id{0} | id{0}'.format(i))
+    lines.append('S{} -> end'.format(size))
+    return '\n'.join(lines)
+
+
+def best(f, repeat):
+    """
+    :return: shortest time of repeat calls to f, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def import_file(path):
+    spec = importlib.util.spec_from_file_location('table', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_import(size, repeat):
+    """
+    Compare importing a module written by --emit-module with rebuilding the table from the grammar
+    """
+    text = synthetic_grammar(size)
+
+    def rebuild():
+        g = default_pipeline().run(parse_bnf(text))
+        return g, g.parsing_table()[0]
+
+    g, table = rebuild()
+    compiled = CompiledTable.from_grammar(g, table)
+    print("Grammar: {} nonterminals, {} terminals".format(len(compiled.symbols) - compiled.width, compiled.width))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'table.py')
+        emit_module(compiled, path, text, cache=False)
+        first = best(lambda: import_file(path), 1)  # Compiles it
+        py_compile.compile(path, doraise=True)
+        cached = best(lambda: import_file(path), repeat)
+        loaded = best(lambda: CompiledTable.from_module(import_file(path)), repeat)
+        data = compiled.to_bytes()
+        from_bytes = best(lambda: CompiledTable.from_buffer(data), repeat)
+
+    results = [
+        ('parse_bnf + passes + parsing_table', best(rebuild, repeat)),
+        ('import without bytecode cache', first),
+        ('import, cached bytecode', cached),
+        ('import + CompiledTable.from_module', loaded),
+        ('CompiledTable.from_buffer', from_bytes),
+    ]
+    width = max(len(name) for name, _ in results)
+    for name, t in results:
+        print('{:{width}} {:10.3f} ms'.format(name, t * 1000, width=width))
+
+
+def bench_recognize(documents, max_length, lanes, repeat, seed=0):
+    """
+    Compare recognizing many short sentences one at a time with CompiledTable.recognize and all together
+    with VectorRecognizer. A third of the sentences have a token replaced, so some are rejected.
+    """
+    g = default_pipeline().run(parse_bnf(COMMANDS.strip()))
+    table = CompiledTable.from_grammar(g)
+    rng = random.Random(seed)
+    terminals = sorted(table.ids)
+    sentences = []
+    for s in SentenceGenerator(g, rng).sentences(documents, max_length=max_length):
+        if s and rng.random() < 1 / 3:
+            s[rng.randrange(len(s))] = rng.choice(terminals)
+        sentences.append(s)
+    print("{} sentences, {} tokens".format(len(sentences), sum(len(s) for s in sentences)))
+
+    recognizer = VectorRecognizer(table, lanes=lanes)
+    scalar = [table.recognize(s) for s in sentences]
+    accepted, positions = recognizer.recognize(sentences)
+    assert scalar == accepted.tolist()
+    print("{} accepted".format(sum(scalar)))
+
+    results = [
+        ('CompiledTable.recognize', best(lambda: [table.recognize(s) for s in sentences], repeat)),
+        ('VectorRecognizer.recognize', best(lambda: recognizer.recognize(sentences), repeat)),
+        ('  VectorRecognizer.encode', best(lambda: recognizer.encode(sentences), repeat)),
+    ]
+    width = max(len(name) for name, _ in results)
+    for name, t in results:
+        print('{:{width}} {:10.3f} ms {:12.0f} sentences/s'.format(name, t * 1000, len(sentences) / t, width=width))
+
+
+def bench_table(size, jobs, repeat):
+    """
+    Compare building the compiled table from the parsing table dict with building it in shards
+    """
+    g = default_pipeline().run(parse_bnf(synthetic_grammar(size)))
+    start = time.perf_counter()
+    g.analysis('follow')  # Shared by every measure
+    analysis = time.perf_counter() - start
+    print("Grammar: {} nonterminals, {} terminals, {} productions".format(
+        len(g.nonterminals), len(g.terminals), sum(1 for _ in g.iter_productions())))
+
+    results = [
+        ('FIRST and FOLLOW', analysis),
+        ('parsing_table + CompiledTable.from_grammar', best(lambda: CompiledTable.from_grammar(g), repeat)),
+        ('build_table, 1 process', best(lambda: build_table(g, jobs=1), repeat)),
+        ('build_table, {} processes'.format(jobs), best(lambda: build_table(g, jobs=jobs), repeat)),
+    ]
+    width = max(len(name) for name, _ in results)
+    for name, t in results:
+        print('{:{width}} {:10.3f} ms'.format(name, t * 1000, width=width))
+
+
+def main(argv):
+    aparse = argparse.ArgumentParser(description='Benchmarks of the LL(1) parser generator.')
+    commands = aparse.add_subparsers(dest='command')
+    command = commands.add_parser('import', help='import a generated table module vs rebuilding the table.')
+    command.add_argument('--size', type=int, default=100, help='size of the synthetic grammar.')
+    command.add_argument('--repeat', type=int, default=5, help='runs of each measure, the best one is shown.')
+    command = commands.add_parser('recognize', help='recognize sentences one by one vs vectorized with NumPy.')
+    command.add_argument('--documents', type=int, default=100000, help='number of sentences.')
+    command.add_argument('--max-length', type=int, default=12, help='maximum number of tokens of a sentence.')
+    command.add_argument('--lanes', type=int, default=65536, help='sentences advanced together by NumPy.')
+    command.add_argument('--repeat', type=int, default=3, help='runs of each measure, the best one is shown.')
+    command = commands.add_parser('table', help='build the compiled table in one process vs sharded in several.')
+    command.add_argument('--size', type=int, default=1000, help='size of the synthetic grammar.')
+    command.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of processes.')
+    command.add_argument('--repeat', type=int, default=3, help='runs of each measure, the best one is shown.')
+    args = aparse.parse_args(argv)
+
+    if args.command == 'import':
+        bench_import(args.size, args.repeat)
+    elif args.command == 'recognize':
+        bench_recognize(args.documents, args.max_length, args.lanes, args.repeat)
+    elif args.command == 'table':
+        bench_table(args.size, args.jobs, args.repeat)
+    else:
+        aparse.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
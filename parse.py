@@ -1,73 +1,461 @@
 #!/usr/bin/env python
+import io
+import os
+import stat
 import sys
-import argparse
+import time
+from collections import namedtuple
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from functools import lru_cache
 
-from parser.functions import parse_bnf, pprint_table, remove_left_recursion, remove_left_factoring
+# Other modules are imported where they are used, so forwarding a command to the daemon (see client) is fast
+from parser.daemon import default_socket, forward
 
 
-def do_the_whole_thing(grammar_text, epsilon='ε', eof='$', output=None, verbose=True):
-    file = None
-    if output:
-        file = open(output, 'w')
+def grammar_size(g):
+    """
+    :return: number of nonterminals and number of productions
+    """
+    return len(g.nonterminals), sum(1 for _ in g.iter_productions())
+
+
+@contextmanager
+def redirect_output(output):
+    """
+    Print to the given file instead of stdout, if any
+    """
+    if not output:
+        yield
+        return
+
+    stdout = sys.stdout
+    with open(output, 'w') as file:
         sys.stdout = file
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+Result = namedtuple('Result', ['stages', 'grammar', 'table', 'ambiguous', 'timings'])
+
+BUILD_CACHE_SIZE = 256
+_cached_build = None  # Set while serving, so only the daemon keeps results between commands
 
-    vprint = print if verbose else lambda *a, **key: None  # Only print if verbose is True
 
-    vprint("Original:")
-    g = parse_bnf(grammar_text, epsilon=epsilon, eof=eof)
-    vprint(g)
+def build(grammar_text, epsilon='ε', eof='$', remove_useless=False):
+    """
+    Run the pipeline and compute the parsing table. While serving (see --serve and cached_builds), results are
+    cached so the daemon only computes each grammar once. Only the final grammar is kept, see stage_grammars.
+    :return: Result with (title, GrammarDiff) for each pass, the final grammar and its table
+    """
+    if _cached_build is not None:
+        return _cached_build(grammar_text, epsilon, eof, remove_useless)
+    return _build(grammar_text, epsilon, eof, remove_useless)
 
-    vprint("\nAfter removing left-recursion:")
-    g = remove_left_recursion(g)
-    vprint(g)
 
-    vprint("\nAfter removing left-factoring:")
-    g = remove_left_factoring(g)
-    vprint(g)
+@contextmanager
+def cached_builds(size=BUILD_CACHE_SIZE):
+    """
+    Keep the results of build for the most recent grammars while the with block runs
+    """
+    global _cached_build
+    previous = _cached_build
+    _cached_build = lru_cache(maxsize=size)(_build)
+    try:
+        yield
+    finally:
+        _cached_build = previous
 
-    vprint()
-    for nt in g.nonterminals:
-        vprint('FIRST({}) = {}'.format(nt, g.first(nt)))
 
-    vprint()
-    follow = [(nt, g.follow(nt)) for nt in g.nonterminals]
+def _build(grammar_text, epsilon, eof, remove_useless):
+    from parser.functions import parse_bnf
+    from parser.passes import REMOVE_USELESS, default_pipeline
 
-    for nt, f in follow:
-        vprint('FOLLOW({}) = {}'.format(nt, f))
+    original = parse_bnf(grammar_text, epsilon=epsilon, eof=eof)
+    titles = []
+    sizes = [grammar_size(original)]
 
-    vprint()
+    def stage(p, grammar):
+        sizes.append(grammar_size(grammar))
+        title = p.title
+        if p is REMOVE_USELESS:
+            before, after = sizes[-2:]
+            title = "After removing useless symbols ({} of {} nonterminals, {} of {} productions removed):".format(
+                before[0] - after[0], before[0], before[1] - after[1], before[1])
+        titles.append(title)
+
+    pipeline = default_pipeline(remove_useless=remove_useless, record_changes=True)
+    g = pipeline.run(original, callback=stage)
     table, ambiguous = g.parsing_table()
-    vprint("Parsing Table: ")
-    if ambiguous:
-        vprint("El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.")
 
-    vprint()
-    pprint_table(g, table)
+    return Result(list(zip(titles, pipeline.changes)), g, table, ambiguous, pipeline.report())
+
+
+def stage_grammars(result):
+    """
+    Rebuild the original grammar and the grammar after each pass, one at a time
+    :param result: Result of build
+    :return: iterable of (title, grammar), starting with the original grammar
+    """
+    from parser.diff import replay, rewind
+
+    diffs = [d for _, d in result.stages]
+    g = rewind(result.grammar, diffs)
+    yield "Original:", g
+    for (title, _), g in zip(result.stages, replay(g, diffs)):
+        yield title, g
+
+
+def do_the_whole_thing(grammar_text, epsilon='ε', eof='$', output=None, verbose=True, fmt='text',
+                       remove_useless=False):
+    from parser.minimize import minimize
+    from parser.render import render_table
+    from parser.runtime import CompiledTable
+
+    with redirect_output(output):
+        vprint = print if verbose else lambda *a, **key: None  # Only print if verbose is True
+
+        result = build(grammar_text, epsilon, eof, remove_useless)
+        g = result.grammar
+
+        for i, (title, grammar) in enumerate(stage_grammars(result) if verbose else ()):
+            vprint("\n" + title if i else title)
+            vprint(grammar)
+
+        vprint()
+        for nt in g.nonterminals:
+            vprint('FIRST({}) = {}'.format(nt, g.first(nt)))
+
+        vprint()
+        follow = [(nt, g.follow(nt)) for nt in g.nonterminals]
+
+        for nt, f in follow:
+            vprint('FOLLOW({}) = {}'.format(nt, f))
+
+        vprint()
+        vprint("Parsing Table: ")
+        if result.ambiguous:
+            vprint("El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.")
+
+        vprint()
+        render_table(g, result.table, fmt)
+
+        vprint("Pass timings:")
+        vprint(result.timings)
+
+        if verbose and not result.ambiguous:
+            print()
+            print("Minimized table: {}".format(minimize(CompiledTable.from_grammar(g, result.table))[1]))
+
+
+def do_modules(path, epsilon='ε', eof='$', output=None, verbose=True, fmt='text', module_cache=None):
+    """
+    Compute the parsing table of a grammar split into modules
+    :param path: main module
+    :param module_cache: file where module analyses are kept between runs
+    """
+    from parser.modules import ModuleCache, load_modules, link_modules
+    from parser.render import render_table
 
-    if file:
-        file.close()
+    with redirect_output(output):
+        vprint = print if verbose else lambda *a, **key: None  # Only print if verbose is True
 
+        cache = ModuleCache.load(module_cache) if module_cache else ModuleCache()
+        modules = load_modules(path, epsilon=epsilon, eof=eof)
+        g, table, ambiguous = link_modules(modules, epsilon=epsilon, eof=eof, cache=cache)
+        if module_cache:
+            cache.save(module_cache)
 
-def main(productions, epsilon, eof, infile, output, verbose):
+        vprint("Modules: {} ({} analysed)".format(', '.join(m.path for m in modules), cache.misses))
+        vprint(g)
+
+        vprint()
+        vprint("Parsing Table: ")
+        if ambiguous:
+            vprint("El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.")
+
+        vprint()
+        render_table(g, table, fmt)
+
+
+def read_grammars(infile):
+    """
+    Read grammars from text files. Grammars in the same file are separated by blank lines.
+    :param infile: list of file names
+    :return: iterable of (file name, grammar text)
+    """
     sentinel = ''
+    for file in infile:
+        with open(file, 'r') as f:
+            text = [l.strip() for l in f.readlines() if not l.startswith('#')] + [sentinel]
+
+            current = []
+            for p in text:
+                if p != sentinel:
+                    current.append(p)
+                # Check if current is not empty, to discard sequence of sentinels
+                elif p == sentinel and current:
+                    yield file, '\n'.join(current)
+                    current = []
+
+
+def check_grammar(grammar_text, epsilon='ε', eof='$', collect_all=False):
+    """
+    Check if a grammar is LL(1) once left-recursion and left-factoring are removed
+    :return: list of conflicts as strings, empty if the grammar is LL(1)
+    """
+    from parser.functions import parse_bnf
+    from parser.passes import default_pipeline
+
+    g = default_pipeline().run(parse_bnf(grammar_text, epsilon=epsilon, eof=eof))
+    return [str(c) for c in g.check_ll1(collect_all=collect_all)]
+
+
+def _check_job(job):
+    from parser.functions import InvalidGrammar
+    from parser.rule import InvalidProduction
+
+    name, grammar_text, epsilon, eof, collect_all = job
+    try:
+        return name, check_grammar(grammar_text, epsilon, eof, collect_all), None
+    except (InvalidGrammar, InvalidProduction) as e:
+        return name, [], 'invalid grammar: {}'.format(e)
+    except Exception as e:  # Reported as this grammar's result, the other grammars are still checked
+        return name, [], 'error: {}: {}'.format(type(e).__name__, e)
+
+
+def check(productions, epsilon, eof, infile, jobs=None, verbose=False):
+    """
+    Validate every grammar in parallel
+    :param verbose: report every conflict of each grammar, and grammars that passed
+    :return: exit status, 0 if all grammars are LL(1)
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
     if infile:
-        for file in infile:
-            with open(file, 'r') as f:
-                text = [l.strip() for l in f.readlines() if not l.startswith('#')] + [sentinel]
-
-                current = []
-                for p in text:
-                    if p != sentinel:
-                        current.append(p)
-                    # Check if current is not empty, to discard sequence of sentinels
-                    elif p == sentinel and current:
-                        do_the_whole_thing('\n'.join(current), epsilon, eof, output=output, verbose=verbose)
-                        current = []
+        grammars = read_grammars(infile)
     else:
-        do_the_whole_thing('\n'.join(productions), epsilon, eof, output=output, verbose=verbose)
+        grammars = [('<args>', '\n'.join(productions))]
 
+    counts = {}
+    queue = []
+    for file, text in grammars:
+        counts[file] = counts.get(file, 0) + 1
+        queue.append(('{}#{}'.format(file, counts[file]), text, epsilon, eof, verbose))
+
+    status = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for name, conflicts, error in executor.map(_check_job, queue, chunksize=16):
+            if error:
+                print('{}: {}'.format(name, error))
+                status = 1
+            elif conflicts:
+                print('{}: not LL(1)'.format(name))
+                for c in conflicts:
+                    print('    {}'.format(c))
+                status = 1
+            elif verbose:
+                print('{}: ok'.format(name))
+
+    return status
+
+
+def write_atomic(path, text):
+    """
+    Replace the contents of a file, readers see either the old or the new contents.
+    The file keeps its permissions, a new file gets those of open().
+    """
+    import tempfile
+
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tmp, mode)  # mkstemp makes it readable only by its owner
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def render_grammar(grammar_text, epsilon='ε', eof='$', verbose=False, fmt='text', remove_useless=False):
+    """
+    :return: the output of do_the_whole_thing as a string
+    """
+    from parser.functions import InvalidGrammar
+    from parser.rule import InvalidProduction
+
+    out = io.StringIO()
+    with redirect_stdout(out):
+        try:
+            do_the_whole_thing(grammar_text, epsilon, eof, verbose=verbose, fmt=fmt, remove_useless=remove_useless)
+        except (InvalidGrammar, InvalidProduction) as e:
+            print('Invalid grammar: {}\n{}\n'.format(e, grammar_text))
+        except Exception as e:  # A watched grammar mustn't stop the rebuilds of the others
+            print('Error: {}: {}\n{}\n'.format(type(e).__name__, e, grammar_text))
+
+    return out.getvalue()
+
+
+def rebuild(infile, rendered, **options):
+    """
+    Render the grammars of infile, reusing the output of those that didn't change
+    :param rendered: output of each grammar from the previous build, keyed by content hash. It is updated.
+    :param options: passed to render_grammar
+    :return: (output of every grammar, output of the grammars rendered again)
+    """
+    import hashlib
+
+    pieces = []
+    changed = []
+    current = set()
+    for file, grammar_text in read_grammars(infile):
+        key = hashlib.sha256(grammar_text.encode('utf-8')).hexdigest()
+        if key not in rendered:
+            rendered[key] = render_grammar(grammar_text, **options)
+            changed.append(rendered[key])
+        current.add(key)
+        pieces.append(rendered[key])
+
+    for key in set(rendered) - current:
+        del rendered[key]  # Grammar was edited or removed
+
+    return pieces, changed
+
+
+def watch(infile, output=None, interval=0.5, **options):
+    """
+    Rebuild the tables every time an input file changes, until interrupted.
+    With output, the whole file is replaced atomically. Otherwise only the grammars that changed are printed.
+    :param interval: seconds between checks of the files' modification times
+    :param options: passed to render_grammar
+    """
+    rendered = {}
+    mtimes = None
+    try:
+        while True:
+            try:
+                current = [os.stat(f).st_mtime_ns for f in infile]
+                if current != mtimes:
+                    mtimes = current
+                    pieces, changed = rebuild(infile, rendered, **options)
+                    if output:
+                        write_atomic(output, ''.join(pieces))
+                    else:
+                        print(''.join(changed), end='', flush=True)
+                    print("Rebuilt {} of {} grammars".format(len(changed), len(pieces)), file=sys.stderr)
+            except OSError as e:  # e.g. an editor replacing the file, try again on next check
+                print(e, file=sys.stderr)
+                mtimes = None
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def generate(productions, epsilon, eof, infile, output, count, max_length=None, seed=None):
+    """
+    Write count random sentences of each grammar, one per line
+    """
+    import random
+    from parser.functions import parse_bnf
+    from parser.generate import SentenceGenerator
+
+    grammars = read_grammars(infile) if infile else [(None, '\n'.join(productions))]
+    rng = random.Random(seed)
+    with redirect_output(output):
+        for file, grammar_text in grammars:
+            g = parse_bnf(grammar_text, epsilon=epsilon, eof=eof)
+            SentenceGenerator(g, rng).write(sys.stdout, count, max_length)
+
+
+def compile_table(result, minimized=False):
+    """
+    :param result: Result of build, for an LL(1) grammar
+    :param minimized: merge equivalent nonterminals and columns, and print the sizes to stderr
+    :return: CompiledTable
+    """
+    from parser.minimize import minimize
+    from parser.runtime import CompiledTable
+
+    # build already computed the table, converting it is cheaper than building the rows again with build_table
+    table = CompiledTable.from_grammar(result.grammar, result.table)
+    if minimized:
+        table, reduction = minimize(table)
+        print("Minimized table: {}".format(reduction), file=sys.stderr)
+    return table
+
+
+def parse_documents(productions, epsilon, eof, infile, output, documents, trees=False, jobs=None, minimized=False):
+    """
+    Parse a file of documents, one per line with space-separated tokens, using the table of a grammar.
+    Prints one result per document and the throughput to stderr.
+    :param documents: path of the documents file
+    :param trees: print the parse tree of each document instead of only checking it
+    :param minimized: parse with the minimized table
+    :return: exit status, 0 if every document was parsed
+    """
+    from parser.batch import BatchParser
+
+    grammar_text = next(read_grammars(infile))[1] if infile else '\n'.join(productions)
+    result = build(grammar_text, epsilon, eof)
+    if result.ambiguous:
+        print("El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.")
+        return 1
+
+    status = 0
+    table = compile_table(result, minimized)
+    with redirect_output(output), open(documents, 'r') as f, BatchParser(table, jobs=jobs) as parser:
+        for r in parser.map((line.split() for line in f), trees=trees):
+            if not r:
+                status = 1
+            print('syntax error' if not r else r if trees else 'ok')
+    print(parser.stats, file=sys.stderr)
+
+    return status
+
+
+def emit(productions, epsilon, eof, infile, path, minimized=False):
+    """
+    Write the parsing table of a grammar as a Python module
+    :param path: file name of the module
+    :param minimized: write the minimized table
+    :return: exit status, 1 if the grammar is not LL(1)
+    """
+    from parser.emit import emit_module
+
+    grammar_text = next(read_grammars(infile))[1] if infile else '\n'.join(productions)
+    result = build(grammar_text, epsilon, eof)
+    if result.ambiguous:
+        print("El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.")
+        return 1
+
+    emit_module(compile_table(result, minimized), path, grammar_text)
+    return 0
+
+
+def main(productions, epsilon, eof, infile, output, verbose, fmt='text', remove_useless=False):
+    with redirect_output(output):  # Opened once, so every grammar of infile is kept
+        if infile:
+            for file, grammar_text in read_grammars(infile):
+                do_the_whole_thing(grammar_text, epsilon, eof, verbose=verbose, fmt=fmt, remove_useless=remove_useless)
+        else:
+            do_the_whole_thing('\n'.join(productions), epsilon, eof, verbose=verbose, fmt=fmt,
+                               remove_useless=remove_useless)
+
+
+def arg_parser():
+    import argparse
+    from parser.generate import DEFAULT_MAX_LENGTH
+    from parser.render import RENDERERS
 
-if __name__ == '__main__':
     aparse = argparse.ArgumentParser(description='Generate Parsing Table for LL(1) grammars.')
     aparse.add_argument('productions', help='productions for grammar.', nargs='*', default=None)
     aparse.add_argument('--epsilon', help='empty symbol.', default='ε')
@@ -75,10 +463,160 @@ if __name__ == '__main__':
     aparse.add_argument('-i', '--input', nargs='*', dest='infile', help='input file with grammar description.')
     aparse.add_argument('-o', '--output', nargs='?', help='sutput file name. File must exist.')
     aparse.add_argument('-v', '--verbose', action='store_true', help='show intermediate steps.')
-    args = aparse.parse_args()
+    aparse.add_argument('-f', '--format', dest='fmt', choices=sorted(RENDERERS), default='text',
+                        help='output format of the parsing table.')
+    aparse.add_argument('-u', '--remove-useless', action='store_true',
+                        help='remove unreachable and unproductive nonterminals before analysis.')
+    aparse.add_argument('-m', '--modules', metavar='MAIN',
+                        help='main module of a grammar split in files with %%include lines.')
+    aparse.add_argument('--module-cache', metavar='FILE', help='file to keep module analyses between runs.')
+    aparse.add_argument('-c', '--check', action='store_true',
+                        help='only check if grammars are LL(1). Exit status is 1 if any grammar is not.')
+    aparse.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes used by --check and --parse.')
+    aparse.add_argument('-w', '--watch', action='store_true',
+                        help='rebuild the tables of the grammars in the input files every time they change.')
+    aparse.add_argument('-g', '--generate', type=int, metavar='N',
+                        help='write N random sentences of each grammar instead of the parsing table.')
+    aparse.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH,
+                        help='maximum number of tokens of generated sentences (default {}).'.format(DEFAULT_MAX_LENGTH))
+    aparse.add_argument('--seed', type=int, help='random seed for --generate.')
+    aparse.add_argument('-p', '--parse', metavar='FILE',
+                        help='parse each line of FILE with the table of the grammar, in parallel.')
+    aparse.add_argument('--trees', action='store_true', help='print the parse tree of each line parsed by --parse.')
+    aparse.add_argument('--emit-module', metavar='FILE',
+                        help='write the parsing table as a Python module that can be imported without this package.')
+    aparse.add_argument('--minimize', action='store_true',
+                        help='merge equivalent nonterminals and terminals with the same column in the table used by '
+                             '--parse and --emit-module.')
+    aparse.add_argument('--serve', action='store_true',
+                        help='run as a daemon that keeps parsed grammars and tables in memory.')
+    aparse.add_argument('--client', action='store_true',
+                        help='send the command to a daemon started with --serve. Runs locally if there is none.')
+    aparse.add_argument('--socket', default=default_socket(), help='Unix socket used by --serve and --client.')
+    return aparse
+
+
+def run(argv):
+    """
+    Run the command line
+    :param argv: arguments, without the program name
+    :return: exit status
+    """
+    from parser.daemon import listening, serve
+
+    args = arg_parser().parse_args(argv)
+
+    if args.serve:
+        if listening(args.socket):
+            print("{}: error: a server is already listening on {}".format(sys.argv[0], args.socket))
+            return 1
+        print("Listening on {}".format(args.socket))
+        with cached_builds():
+            serve(args.socket, handle_request)
+        return 0
+
+    if args.client:
+        argv = [a for a in argv if a != '--client']
+        response = forward(args.socket, argv)
+        if response is None:
+            return run(argv)  # No daemon running
+        status, output = response
+        sys.stdout.write(output)
+        return status
 
     if args.productions and args.infile:
         print("{}: error: argument -i/--input: not allowed with argument productions".format(sys.argv[0]))
-        sys.exit(1)
+        return 1
+
+    if args.watch:
+        if not args.infile:
+            print("{}: error: argument -w/--watch: requires argument -i/--input".format(sys.argv[0]))
+            return 1
+        watch(args.infile, output=args.output, epsilon=args.epsilon, eof=args.eof, verbose=args.verbose,
+              fmt=args.fmt, remove_useless=args.remove_useless)
+        return 0
+
+    if args.generate is not None:
+        generate(args.productions, args.epsilon, args.eof, args.infile, args.output, args.generate,
+                 max_length=args.max_length, seed=args.seed)
+        return 0
+
+    if args.emit_module:
+        return emit(args.productions, args.epsilon, args.eof, args.infile, args.emit_module, minimized=args.minimize)
+
+    if args.parse:
+        return parse_documents(args.productions, args.epsilon, args.eof, args.infile, args.output, args.parse,
+                               trees=args.trees, jobs=args.jobs, minimized=args.minimize)
 
-    main(**vars(args))
+    if args.modules:
+        do_modules(args.modules, args.epsilon, args.eof, output=args.output, verbose=args.verbose, fmt=args.fmt,
+                   module_cache=args.module_cache)
+        return 0
+
+    if args.check:
+        return check(args.productions, args.epsilon, args.eof, args.infile, jobs=args.jobs, verbose=args.verbose)
+
+    main(args.productions, args.epsilon, args.eof, args.infile, args.output, args.verbose, args.fmt,
+         args.remove_useless)
+    return 0
+
+
+def handle_request(argv, cwd):
+    """
+    Run a command line sent by a client, in the client's directory.
+    Options that would start another server, forward the request again or never return are rejected.
+    :return: (exit status, output)
+    """
+    import traceback
+
+    out = io.StringIO()
+    previous = os.getcwd()
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(out), redirect_stderr(out):
+            try:
+                args = arg_parser().parse_args(argv)
+                rejected = [name for name in ('serve', 'client', 'watch') if getattr(args, name)]
+                if rejected:
+                    print("{} not allowed in client requests".format(', '.join('--' + n for n in rejected)))
+                    status = 2
+                else:
+                    status = run(argv)
+            except SystemExit as e:  # argparse errors and --help
+                status = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        os.chdir(previous)
+
+    return status, out.getvalue()
+
+
+def client(argv):
+    """
+    Forward a command line with --client to the daemon, without importing the rest of the package.
+    Only the exact --client and --socket options are recognized here, anything else is left to run.
+    :return: exit status, or None if argv doesn't use --client or no daemon is listening
+    """
+    if '--client' not in argv:
+        return None
+    path = default_socket()
+    for i, a in enumerate(argv):
+        if a == '--socket' and i + 1 < len(argv):
+            path = argv[i + 1]
+        elif a.startswith('--socket='):
+            path = a[len('--socket='):]
+
+    response = forward(path, [a for a in argv if a != '--client'])
+    if response is None:
+        return None
+    status, output = response
+    sys.stdout.write(output)
+    return status
+
+
+if __name__ == '__main__':
+    status = client(sys.argv[1:])
+    sys.exit(run(sys.argv[1:]) if status is None else status)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Parse many documents with the same grammar in parallel.
+
+The compiled table is written once to shared memory. Worker processes map it when they start, so neither the
+table nor the grammar is pickled with each task; only the documents and the results travel between processes.
+"""
+import gc
+import itertools
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, util
+
+from parser.runtime import CompiledTable, ParseError
+
+_worker = {}  # Shared memory and table of the current worker process
+
+
+def _attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    _worker['shm'] = shm
+    _worker['table'] = CompiledTable.from_buffer(shm.buf)
+    util.Finalize(None, _detach, exitpriority=10)  # Run when the worker exits, atexit handlers aren't
+
+
+def _detach():
+    # The table's view of the shared memory is released first, otherwise it can't be closed
+    _worker.pop('table').release()
+    _worker.pop('shm').close()
+
+
+def _parse_chunk(job):
+    trees, documents = job
+    table = _worker['table']
+    results = []
+    tokens = 0
+    if trees:
+        gc.disable()  # Trees have no cycles, don't scan them again and again while they are built
+    try:
+        for d in documents:
+            d = d.split() if isinstance(d, str) else d
+            tokens += len(d)
+            if not trees:
+                results.append(table.recognize(d))
+                continue
+            try:
+                results.append(table.parse(d))
+            except ParseError:
+                results.append(None)
+    finally:
+        gc.enable()
+
+    return results, tokens
+
+
+class BatchStats(namedtuple('BatchStats', ['documents', 'tokens', 'seconds'])):
+    """
+    Throughput of a batch
+    """
+
+    @property
+    def documents_per_second(self):
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return "{} documents, {} tokens in {:.3f} s ({:.0f} documents/s, {:.0f} tokens/s)".format(
+            self.documents, self.tokens, self.seconds, self.documents_per_second, self.tokens_per_second)
+
+
+class BatchParser:
+    """
+    Process pool sharing a compiled table. Use it as a context manager:
+
+    with BatchParser(table, jobs=4) as parser:
+        for ok in parser.map(documents):
+            ...
+    print(parser.stats)
+    """
+
+    def __init__(self, table, jobs=None, chunksize=256):
+        """
+        :param table: CompiledTable
+        :param jobs: number of processes, one per CPU by default
+        :param chunksize: documents sent to a process at a time
+        """
+        self.table = table
+        self.jobs = jobs or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.stats = BatchStats(0, 0, 0.0)
+        self.shm = None
+        self.executor = None
+
+    def __enter__(self):
+        data = self.table.to_bytes()
+        self.shm = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            self.shm.buf[:len(data)] = data
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_attach,
+                                                initargs=(self.shm.name,))
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shm:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def map(self, documents, trees=False):
+        """
+        Parse documents, a few chunks at a time so large inputs aren't loaded at once
+        :param documents: iterable of documents, each a string of space-separated tokens or a sequence of tokens
+        :param trees: build parse trees instead of only recognizing the documents
+        :return: iterable of results in the order of documents. True/False when recognizing,
+        a Node or None for documents with syntax errors when building trees
+        """
+        start = time.perf_counter()
+        count = tokens = 0
+        documents = iter(documents)
+        pending = deque()
+        while True:
+            # Keep every process busy with the next chunk while results are consumed
+            while len(pending) < 2 * self.jobs:
+                chunk = list(itertools.islice(documents, self.chunksize))
+                if not chunk:
+                    break
+                pending.append(self.executor.submit(_parse_chunk, (trees, chunk)))
+            if not pending:
+                break
+
+            results, n = pending.popleft().result()
+            count += len(results)
+            tokens += n
+            self.stats = BatchStats(count, tokens, time.perf_counter() - start)
+            for r in results:
+                yield r
+
+
+def parse_batch(table, documents, trees=False, jobs=None, chunksize=256):
+    """
+    Parse documents with a pool of processes sharing the table
+    :param table: CompiledTable
+    :param documents: iterable of documents, see BatchParser.map
+    :return: (list of results in the order of documents, BatchStats)
+    """
+    with BatchParser(table, jobs=jobs, chunksize=chunksize) as parser:
+        results = list(parser.map(documents, trees=trees))
+    return results, parser.stats
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Run commands in a long-running process, sent through a Unix domain socket.
+
+Only the user running the server may use it: the socket is created with mode 0600, by default in $XDG_RUNTIME_DIR
+or in a directory only that user can open, and both ends check the user of the other one when the system tells it.
+"""
+import errno
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import threading
+
+
+def default_socket():
+    """
+    Socket path used when none is given, one per user: in $XDG_RUNTIME_DIR, or in a private directory of the
+    temporary directory that serve creates
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'll1-parser.sock')
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    tmp = os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(tmp, 'll1-parser-{}'.format(uid), 'server.sock')
+
+
+def peer_uid(connection):
+    """
+    :return: user id of the process at the other end of a Unix socket, None where the system doesn't tell it
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    size = struct.calcsize('3i')
+    pid, uid, gid = struct.unpack('3i', connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size))
+    return uid
+
+
+def _private_directory(path):
+    """
+    Create the directory of the socket, readable only by its owner, if it doesn't exist
+    :raise PermissionError: if it belongs to another user or other users can open it
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(errno.EPERM, 'Socket directory must belong to this user, with mode 0700', directory)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON line per request: {"argv": [...], "cwd": "..."}
+    One JSON line per response: {"status": 0, "output": "..."}
+    """
+
+    def handle(self):
+        uid = peer_uid(self.connection)
+        if uid is not None and uid != os.getuid():
+            return  # Only the user running the server may use it
+        line = self.rfile.readline()
+        if not line:
+            return  # Connection closed without a request, see listening
+        try:
+            request = json.loads(line.decode('utf-8'))
+            status, output = self.server.handler(request['argv'], request['cwd'])
+        except (ValueError, KeyError) as e:
+            status, output = 2, 'invalid request: {}\n'.format(e)
+
+        response = json.dumps({'status': status, 'output': output}, ensure_ascii=False)
+        self.wfile.write(response.encode('utf-8') + b'\n')
+
+
+def listening(path):
+    """
+    :return: True if a server accepts connections on path
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+    finally:
+        client.close()
+    return True
+
+
+def serve(path, handler):
+    """
+    Handle requests on a Unix domain socket until interrupted or terminated.
+    Requests are handled one at a time, so handler may redirect stdout or change directory.
+    :param path: socket path
+    :param handler: function (argv, cwd) -> (exit status, output text)
+    :raise OSError: if another server is listening on path, or the directory of a default path isn't private
+    """
+    if path == default_socket() and not os.environ.get('XDG_RUNTIME_DIR'):
+        _private_directory(path)
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        if listening(path):
+            raise OSError(errno.EADDRINUSE, 'A server is already listening', path)
+        os.unlink(path)  # Left by a previous server
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+
+    umask = os.umask(0o177)  # No other user can connect, even before the chmod
+    try:
+        server = socketserver.UnixStreamServer(path, RequestHandler)
+    finally:
+        os.umask(umask)
+    os.chmod(path, 0o600)
+    server.handler = handler
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def forward(path, argv, cwd=None):
+    """
+    Send a command line to a running server of the current user
+    :return: (exit status, output text), or None if no server of this user is listening on path
+    """
+    try:
+        if os.stat(path).st_uid != os.getuid():
+            return None  # Another user could read the command line
+    except FileNotFoundError:
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            client.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        uid = peer_uid(client)
+        if uid is not None and uid != os.getuid():
+            return None
+
+        request = json.dumps({'argv': list(argv), 'cwd': cwd or os.getcwd()}, ensure_ascii=False)
+        client.sendall(request.encode('utf-8') + b'\n')
+
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+        return response['status'], response['output']
+    finally:
+        client.close()
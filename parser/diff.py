@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Changes between two versions of a grammar.
+
+The passes of a pipeline only change part of the grammar, so instead of keeping the grammar after each pass,
+the intermediate steps are kept as the changes from one to the next. Any step can be rebuilt from the grammar
+before or after it, one step at a time, so there is only one intermediate grammar in memory at once.
+"""
+from collections import OrderedDict, namedtuple
+
+from parser.grammar import Grammar
+from parser.rule import Rule
+
+
+def _rename(rule, names):
+    if not names:
+        return rule
+    return Rule(names.get(rule.head, rule.head), tuple(names.get(s, s) for s in rule.body))
+
+
+def _renamed(old, new):
+    """
+    Nonterminals of old that are in new with another name: the new one has the same productions, with its
+    name where the old one had its own
+    :return: OrderedDict from old names to new names
+    """
+    gone = [x for x in old.nonterminals if x not in new.productions]
+    appeared = [y for y in new.nonterminals if y not in old.productions]
+    if not gone or not appeared:
+        return OrderedDict()
+
+    def signature(g, x):
+        return frozenset(tuple(None if s == x else s for s in r.body) for r in g.productions[x])
+
+    candidates = {}
+    for y in appeared:
+        if new.productions[y]:
+            candidates.setdefault(signature(new, y), []).append(y)
+    names = OrderedDict()
+    for x in gone:
+        same = candidates.get(signature(old, x))
+        if same:
+            names[x] = same.pop(0)
+    return names
+
+
+class GrammarDiff(namedtuple('GrammarDiff', ['renamed', 'removed', 'added', 'before', 'after'])):
+    """
+    Changes from one grammar to another: nonterminals renamed (an OrderedDict from old to new names), then
+    productions removed and added, written with the new names. before and after are the start symbol and the
+    nonterminals in order of each grammar, so either one is rebuilt exactly from the other.
+    """
+
+    @staticmethod
+    def between(old, new):
+        """
+        :return: changes from grammar old to grammar new
+        """
+        before = (old.start, tuple(old.nonterminals))
+        after = (new.start, tuple(new.nonterminals))
+        if old is new:
+            return GrammarDiff(OrderedDict(), [], [], before, after)
+
+        names = _renamed(old, new)
+        renamed = OrderedDict((names.get(x, x), [_rename(r, names) for r in rules])
+                              for x, rules in old.productions.items())
+        removed = []
+        added = []
+        for x in list(renamed) + [y for y in new.nonterminals if y not in renamed]:
+            a = renamed.get(x, [])
+            b = new.productions.get(x, [])
+            # Productions in the same position at the start are kept, the rest are replaced
+            same = 0
+            while same < min(len(a), len(b)) and a[same] == b[same]:
+                same += 1
+            removed.extend(a[same:])
+            added.extend(b[same:])
+
+        return GrammarDiff(names, removed, added, before, after)
+
+    def apply(self, g):
+        """
+        :param g: the grammar the changes were computed from, or an equal one
+        :return: the grammar the changes lead to
+        """
+        removed = set(self.removed)
+        productions = OrderedDict((x, []) for x in self.after[1])
+        for rule in g.iter_productions():
+            rule = _rename(rule, self.renamed)
+            if rule not in removed:
+                productions[rule.head].append(rule)
+        for rule in self.added:
+            productions[rule.head].append(rule)
+
+        return Grammar(productions, start=self.after[0], epsilon=g.epsilon, eof=g.eof)
+
+    def invert(self):
+        """
+        :return: changes that undo these ones
+        """
+        names = OrderedDict((y, x) for x, y in self.renamed.items())
+        return GrammarDiff(names, [_rename(r, names) for r in self.added], [_rename(r, names) for r in self.removed],
+                           self.after, self.before)
+
+    def __bool__(self):
+        return bool(self.renamed or self.removed or self.added or self.before != self.after)
+
+    def __str__(self):
+        lines = ['{} renamed to {}'.format(x, y) for x, y in self.renamed.items()]
+        lines.extend('- {}'.format(r) for r in self.removed)
+        lines.extend('+ {}'.format(r) for r in self.added)
+        return '\n'.join(lines)
+
+
+def replay(g, diffs):
+    """
+    :param g: grammar before the first changes
+    :param diffs: GrammarDiff of each step, in order
+    :return: iterable of the grammar after each step
+    """
+    for d in diffs:
+        g = d.apply(g)
+        yield g
+
+
+def rewind(g, diffs):
+    """
+    :param g: grammar after the last changes
+    :param diffs: GrammarDiff of each step, in order
+    :return: grammar before the first step
+    """
+    for d in reversed(diffs):
+        g = d.invert().apply(g)
+    return g
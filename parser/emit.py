@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Write a compiled parsing table as a Python module.
+
+The module only has constants (tuples, ints and strings) and a small predictive parser, so once CPython has cached
+its bytecode, importing it loads the table without the parser package and without analysing the grammar.
+"""
+import py_compile
+
+HEADER = '''# -*- coding: utf-8 -*-
+"""
+LL(1) parsing table generated by parse.py --emit-module. Do not edit.
+{grammar}
+"""
+'''
+
+# Same algorithm as CompiledTable.recognize and CompiledTable.parse, without depending on the parser package
+DRIVER = '''
+IDS = {s: i for i, s in enumerate(SYMBOLS[:WIDTH - 1])}
+EOF = WIDTH - 1
+
+
+def _stream(tokens):
+    stream = []
+    for pos, t in enumerate(tokens):
+        if t not in IDS:
+            raise ValueError("Unknown token {} at position {}".format(t, pos))
+        stream.append(IDS[t])
+    stream.append(EOF)
+    return stream
+
+
+def recognize(tokens):
+    """
+    :param tokens: sequence of terminals
+    :return: True if tokens is a sentence of the grammar, False otherwise
+    """
+    try:
+        stream = _stream(tokens)
+    except ValueError:
+        return False
+
+    stack = [START]
+    pos = 0
+    lookahead = stream[0]
+    while stack:
+        s = stack.pop()
+        if s < WIDTH:
+            if s != lookahead:
+                return False
+            pos += 1
+            lookahead = stream[pos]
+        else:
+            r = ACTIONS[s - WIDTH][COLUMNS[lookahead]]
+            if r < 0:
+                return False
+            stack.extend(BODIES[r])
+
+    return lookahead == EOF
+
+
+def parse(tokens):
+    """
+    :param tokens: sequence of terminals
+    :return: parse tree. Terminals are strings, nonterminals are (symbol, list of children) tuples
+    :raise ValueError: if tokens is not a sentence of the grammar
+    """
+    stream = _stream(tokens)
+    top = []
+    stack = [(START, top)]
+    pos = 0
+    while stack:
+        s, siblings = stack.pop()
+        lookahead = stream[pos]
+        if s < WIDTH:
+            if s != lookahead:
+                raise ValueError("Expected {} at position {}, found {}".format(SYMBOLS[s], pos, SYMBOLS[lookahead]))
+            siblings.append(SYMBOLS[s])
+            pos += 1
+            continue
+
+        r = ACTIONS[s - WIDTH][COLUMNS[lookahead]]
+        if r < 0:
+            raise ValueError("Unexpected {} at position {}".format(SYMBOLS[lookahead], pos))
+        if not INLINE[s - WIDTH]:
+            node = (SYMBOLS[s], [])
+            siblings.append(node)
+            siblings = node[1]
+        for c in BODIES[r]:
+            stack.append((c, siblings))
+
+    if stream[pos] != EOF:
+        raise ValueError("Expected end of input at position {}, found {}".format(pos, SYMBOLS[stream[pos]]))
+
+    return top[0]
+'''
+
+
+def _tuple(items):
+    """
+    :return: source of a tuple literal, with the trailing comma of one-item tuples
+    """
+    items = list(items)
+    return '({}{})'.format(', '.join(items), ',' if len(items) == 1 else '')
+
+
+def module_source(table, grammar_text=''):
+    """
+    :param table: CompiledTable
+    :param grammar_text: grammar the table was built from, copied to the module docstring
+    :return: source code of the module
+    """
+    rows = len(table.symbols) - table.width
+    grammar_text = grammar_text.replace('\\', '\\\\').replace('"""', '\\"\\"\\"')
+    lines = [HEADER.format(grammar='\n'.join('    ' + l for l in grammar_text.split('\n')) if grammar_text else '')]
+    lines.append('SYMBOLS = {}'.format(_tuple(repr(s) for s in table.symbols)))
+    lines.append('WIDTH = {}'.format(table.width))
+    lines.append('START = {}'.format(table.start))
+    lines.append('COLUMNS = {}'.format(_tuple(str(c) for c in table.columns)))
+    lines.append('INLINE = {}'.format(_tuple(str(x in table.inline) for x in range(table.width, len(table.symbols)))))
+    lines.append('RULES = (')
+    for head, body in table.rules:
+        lines.append('    ({}, {}),'.format(head, _tuple(str(s) for s in body)))
+    lines.append(')')
+    lines.append('BODIES = (')
+    for body in table.bodies:
+        lines.append('    {},'.format(_tuple(str(s) for s in body)))
+    lines.append(')')
+    lines.append('ACTIONS = (')
+    for row in range(rows):
+        actions = table.actions[row * table.stride:(row + 1) * table.stride]
+        lines.append('    {},'.format(_tuple(str(a) for a in actions)))
+    lines.append(')')
+
+    return '\n'.join(lines) + '\n' + DRIVER
+
+
+def emit_module(table, path, grammar_text='', cache=True):
+    """
+    Write the module for a table
+    :param path: file name, ending in .py
+    :param cache: also write its bytecode to __pycache__, so even the first import doesn't compile it
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(module_source(table, grammar_text))
+    if cache:
+        py_compile.compile(path, doraise=True)
@@ -1,18 +1,24 @@
 # -*- coding: utf-8 -*-
+import re
 from collections import OrderedDict
 from copy import copy
 
 from parser.rule import Rule
 
 from parser.grammar import Grammar, InvalidGrammar
+from parser.render import TextRenderer
 
+EBNF_DIRECTIVE = '%ebnf'
+EBNF_TOKEN = re.compile(r"\s*(?:'([^'\s]+)'|([()|*+?])|([^\s()|*+?'][^\s()|*+?]*))")
 
-def parse_bnf(text, epsilon='ε', eof='$'):
+
+def parse_bnf(text, epsilon='ε', eof='$', ebnf=False):
     """
     Parse BNF from text
     :param text: grammar especification
     :param epsilon: empty symbol
     :param eof: EOF symbol
+    :param ebnf: accept EBNF operators, also enabled by a %ebnf line in text
     :return: a grammar
 
     Productions use the following format:
@@ -21,11 +27,23 @@ def parse_bnf(text, epsilon='ε', eof='$'):
     A -> ( A ) | Two
     Two -> a
     Two -> b
+
+    In EBNF mode, ( ) group alternatives, X* repeats X zero or more times, X+ one or more times and X? makes it
+    optional. Terminals that are also operators are quoted:
+
+    %ebnf
+    List -> '(' id ( ',' id )* ')'
     """
     try:
         productions = [p for p in text.strip().split('\n') if not p.startswith('#')]
+        if any(p.strip() == EBNF_DIRECTIVE for p in productions):
+            ebnf = True
+            productions = [p for p in productions if p.strip() != EBNF_DIRECTIVE]
         start = productions[0].split('->')[0].strip()  # First rule as starting symbol
         g = Grammar(start=start, epsilon=epsilon, eof=eof)
+        if ebnf:
+            __parse_ebnf(g, productions)
+            return g
 
         for r in productions:
             head, body = [x.strip() for x in r.split('->')]
@@ -39,18 +57,112 @@ def parse_bnf(text, epsilon='ε', eof='$'):
         raise InvalidGrammar("Invalid grammar", text)
 
 
+def __parse_ebnf(g, lines):
+    """
+    Add the productions of EBNF lines to a grammar. Each group, option and repetition gets a nonterminal, named
+    after the production it first appears in and shared by identical subexpressions, and listed in g.inline:
+    X* becomes N -> X N | ε, X? becomes N -> X | ε and X+ becomes X N*, with N* the nonterminal of X*.
+    The parsing table checks them like any other nonterminal and the runtime parses them like any other
+    nonterminal, but adds their symbols to the node of the production they appear in instead of making nodes.
+    :raise ValueError: on syntax errors
+    """
+    rules = [(head.strip(), __ebnf_tokens(body)) for head, body in (l.split('->') for l in lines)]
+    used = {h for h, _ in rules} | {t for _, body in rules for _, t in body}
+    helpers = OrderedDict()  # Canonical text of the subexpression -> (nonterminal, alternatives)
+
+    def helper(head, key, alternatives):
+        """
+        :param alternatives: function that takes the name of the nonterminal and returns its bodies
+        """
+        if key not in helpers:
+            n = 1
+            while '{}_{}'.format(head, n) in used:
+                n += 1
+            name = '{}_{}'.format(head, n)
+            used.add(name)
+            helpers[key] = (name, alternatives(name))
+        return helpers[key][0]
+
+    def alternatives(head, tokens, i):
+        result = []
+        while True:
+            sequence, text, i = items(head, tokens, i)
+            result.append((sequence, text))
+            if i == len(tokens) or tokens[i] != ('op', '|'):
+                return result, i
+            i += 1
+
+    def items(head, tokens, i):
+        sequence = []
+        texts = []
+        while i < len(tokens) and tokens[i] not in (('op', '|'), ('op', ')')):
+            kind, value = tokens[i]
+            if kind == 'op' and value != '(':
+                raise ValueError("Operator {} without operand".format(value))
+            if kind == 'op':
+                group, i = alternatives(head, tokens, i + 1)
+                if i == len(tokens):
+                    raise ValueError("Unclosed (")
+                text = '( {} )'.format(' | '.join(t for _, t in group))
+                symbols = group[0][0] if len(group) == 1 else [helper(head, text, lambda n: [s for s, _ in group])]
+            else:
+                text, symbols = "'{}'".format(value) if kind == 'quoted' else value, [value]
+            i += 1
+            while i < len(tokens) and tokens[i] in (('op', '*'), ('op', '+'), ('op', '?')):
+                op = tokens[i][1]
+                if op == '?':
+                    symbols = [helper(head, text + '?', lambda n, x=symbols: [x, []])]
+                else:
+                    repeated = helper(head, text + '*', lambda n, x=symbols: [x + [n], []])
+                    symbols = [repeated] if op == '*' else symbols + [repeated]
+                text += op
+                i += 1
+            sequence.extend(symbols)
+            texts.append(text)
+        return sequence, ' '.join(texts), i
+
+    for head, tokens in rules:
+        body, i = alternatives(head, tokens, 0)
+        if i != len(tokens):
+            raise ValueError("Unmatched )")
+        for sequence, _ in body:
+            g.add_rule(Rule(head, tuple(sequence or [g.epsilon])))
+
+    for x, bodies in helpers.values():
+        for sequence in bodies:
+            g.add_rule(Rule(x, tuple(sequence or [g.epsilon])))
+    g.inline = {x for x, _ in helpers.values()}
+
+
+def __ebnf_tokens(text):
+    """
+    :return: list of ('op', operator), ('symbol', name) and ('quoted', name) pairs
+    """
+    tokens = []
+    i = 0
+    text = text.rstrip()
+    while i < len(text):
+        m = EBNF_TOKEN.match(text, i)
+        if m is None:
+            raise ValueError("Invalid EBNF at {}".format(text[i:]))
+        quoted, op, symbol = m.groups()
+        tokens.append(('op', op) if op else ('quoted', quoted) if quoted else ('symbol', symbol))
+        i = m.end()
+    return tokens
+
+
 def __normalize_productions(grammar):
     """
     Remove empty symbols from productions
     :param grammar: input grammar
     :return: normalized grammar
     """
-    normalized_grammar = copy(grammar)
+    normalized_grammar = Grammar(start=grammar.start, epsilon=grammar.epsilon, eof=grammar.eof)
 
-    for x in grammar.nonterminals:
-        for p in grammar.productions[x]:
-            if len(p.body) > 1:  # exclude productions of the form X -> ε
-                p.body = tuple([x for x in p.body if x != grammar.epsilon])
+    for p in grammar.iter_productions():
+        if len(p.body) > 1 and grammar.epsilon in p.body:  # exclude productions of the form X -> ε
+            p = Rule(p.head, tuple([x for x in p.body if x != grammar.epsilon]))
+        normalized_grammar.add_rule(p)
 
     return normalized_grammar
 
@@ -110,12 +222,51 @@ def remove_immediate_left_recursion(grammar, A):
     return new_productions
 
 
+def has_left_recursion(grammar):
+    """
+    Check if a nonterminal can derive a string starting with itself, i.e. if the left-corner graph has a cycle
+    :param grammar: input grammar
+    :return: True if grammar is left-recursive (immediate or indirect). False otherwise
+    """
+    corners = grammar.analysis('left-corner')
+    state = {}  # Missing: not visited, False: in current path, True: done
+    for root in corners:
+        if root in state:
+            continue
+        state[root] = False
+        stack = [(root, iter(corners[root]))]
+        while stack:
+            x, successors = stack[-1]
+            for y in successors:
+                if y not in state:
+                    state[y] = False
+                    stack.append((y, iter(corners[y])))
+                    break
+                elif state[y] is False:
+                    return True
+            else:
+                state[x] = True
+                stack.pop()
+
+    return False
+
+
+def is_normalized(grammar):
+    """
+    Check if the empty symbol only appears in productions of the form X -> ε
+    """
+    return not any(len(p.body) > 1 and grammar.epsilon in p.body for p in grammar.iter_productions())
+
+
 def remove_left_recursion(g):
     """
     Remove all left recursions from grammar
     :param g: input grammar
-    :return: equivalent grammar with no left-recursions
+    :return: equivalent grammar with no left-recursions. If there are none, the same grammar is returned.
     """
+    if is_normalized(g) and not has_left_recursion(g):
+        return g
+
     temp_grammar = copy(g)
     new_grammar = Grammar(start=temp_grammar.start, epsilon=temp_grammar.epsilon, eof=temp_grammar.eof)
     nonterminals = nonterminal_ordering(temp_grammar)
@@ -143,6 +294,73 @@ def remove_left_recursion(g):
     return __normalize_productions(new_grammar)
 
 
+def remove_useless_symbols(grammar):
+    """
+    Remove unproductive and unreachable nonterminals, with all their productions.
+    Runs in time linear in the size of the grammar.
+    :param grammar: input grammar
+    :return: equivalent grammar where every nonterminal is reachable from the start symbol and derives a terminal string.
+    If there are no useless symbols, the same grammar is returned.
+
+    1- A nonterminal is productive if one of its productions only has terminals and productive nonterminals
+    2- A nonterminal is reachable if it is the start symbol or appears in a production of a reachable nonterminal
+    """
+    rules = list(grammar.iter_productions())
+    occurrences = {x: [] for x in grammar.nonterminals}  # Productions where each nonterminal appears
+    pending = []  # Number of nonterminals not yet known to be productive, for each production
+    productive = set()
+    worklist = []
+
+    for i, r in enumerate(rules):
+        n = 0
+        for symbol in r.body:
+            if symbol in occurrences:
+                occurrences[symbol].append(i)
+                n += 1
+        pending.append(n)
+        if n == 0 and r.head not in productive:
+            productive.add(r.head)
+            worklist.append(r.head)
+
+    while worklist:
+        x = worklist.pop()
+        for i in occurrences[x]:
+            pending[i] -= 1
+            head = rules[i].head
+            if pending[i] == 0 and head not in productive:
+                productive.add(head)
+                worklist.append(head)
+
+    if grammar.start not in productive:
+        raise InvalidGrammar("Start symbol doesn't derive any terminal string", str(grammar))
+
+    productions = OrderedDict()
+    for r, n in zip(rules, pending):
+        if n == 0:
+            productions.setdefault(r.head, []).append(r)
+
+    reachable = {grammar.start}
+    worklist = [grammar.start]
+    while worklist:
+        x = worklist.pop()
+        for r in productions[x]:
+            for symbol in r.body:
+                if symbol in productions and symbol not in reachable:
+                    reachable.add(symbol)
+                    worklist.append(symbol)
+
+    if len(reachable) == len(grammar.nonterminals) and all(n == 0 for n in pending):
+        return grammar  # Nothing to remove
+
+    new_grammar = Grammar(start=grammar.start, epsilon=grammar.epsilon, eof=grammar.eof)
+    for x, rs in productions.items():
+        if x in reachable:
+            for r in rs:
+                new_grammar.add_rule(r)
+
+    return new_grammar
+
+
 def check_items_equal(l):
     """
     Check if all items from a list are equal
@@ -166,7 +384,7 @@ def get_prefixes(productions):
     sorted_productions = sorted(productions)
     for x in sorted_productions:
         if x:
-            common.setdefault(x[0], []).append(x)
+            common.setdefault((x[0],), []).append(x)
     for k, v in common.items():
         common_index = 0
         if (len(v) > 1):
@@ -179,7 +397,7 @@ def get_prefixes(productions):
             common[k] = [l[common_index + 1:] for l in v]
         if common_index > 0:
             common[k] = [l[common_index + 1:] for l in v]
-            final_key = ' '.join(v[0][0:common_index + 1])
+            final_key = tuple(v[0][0:common_index + 1])
             common[final_key] = common[k]
             del common[k]
 
@@ -231,7 +449,7 @@ def __remove_left_factoring(grammar):
                     new_productions.append(Rule(nonterminal, tuple(v[0])))
                     continue
                 new_x = __generate_key(grammar, nonterminal)
-                body = [prefix] + [new_x]
+                body = list(prefix) + [new_x]
                 new_productions.append(Rule(nonterminal, tuple(body)))
                 for prod in v:
                     if not prod:
@@ -246,44 +464,12 @@ def __remove_left_factoring(grammar):
     return __normalize_productions(new_grammar)
 
 
-def __join_amb(entry):
+def pprint_table(g, table, padding=4, file=None):
     """
-    Join ambigous entry from parsing table
+    Print parsing table as a fixed-width text table
+    :param g: the grammar the table was computed for
+    :param table: parsing table
+    :param padding: extra space around each entry
+    :param file: output file object, defaults to stdout
     """
-    return ' | '.join([str(e) for e in entry])
-
-
-# WARNING: code is a mess
-def pprint_table(g, table, padding=4):
-    terminals = sorted(set(g.terminals) - {g.epsilon}) + [g.eof]  # put EOF at end of list
-    nonterminals = [nt for nt in g.nonterminals]
-
-    width_nt = max([len(x) for x in nonterminals])  # non_terminals width
-    width = max([len(str(p)) for p in g.iter_productions()])
-
-    amb = [len(__join_amb(x)) for x in table.values() if isinstance(x, list)]
-    if amb:
-        width = max(width, *amb)
-
-    width += padding
-    if width % 2 == 0:
-        width += 1  # Width must be odd to center correctly
-
-    print('{:{width}}'.format('', width=width_nt + 2), end='')
-    for t in terminals:
-        print('{:^{width}}'.format(t, width=width), end='')
-
-    print()
-    print('-' * ((len(terminals)) * width + width_nt))
-
-    print()
-    for x in nonterminals:
-        print('{:{width}} |'.format(x, width=width_nt), end='')
-        for t in terminals:
-            entry = table.get((x, t), '-')
-            if isinstance(entry, list):
-                entry = __join_amb(entry)
-            print('{:^{width}}'.format(str(entry), width=width), end='')
-
-        print()
-    print()
+    TextRenderer(file, padding=padding).render(g, table)
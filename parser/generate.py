@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import bisect
+import heapq
+import random
+
+from parser.grammar import InvalidGrammar
+
+INFINITY = float('inf')
+DEFAULT_MAX_LENGTH = 100
+EXPANSIONS_PER_TOKEN = 4  # Nullable recursion expands nonterminals without adding tokens, so expansions are limited too
+
+
+def min_lengths(g):
+    """
+    Compute the length of the shortest terminal string each nonterminal derives.
+    :param g: input grammar
+    :return: dict from nonterminal to length, infinite for nonterminals that derive no terminal string
+    """
+    return shortest_derivations(g)[0]
+
+
+def shortest_derivations(g):
+    """
+    Compute the length of the shortest terminal string each nonterminal derives, and a production that starts it.
+    Uses Knuth's generalization of Dijkstra's algorithm: nonterminals are settled in order of length,
+    and a production is considered once all the nonterminals in its body are settled. The nonterminals in the body
+    of the production that settles a nonterminal were settled before it, so always expanding those productions ends.
+    :param g: input grammar
+    :return: (dict from nonterminal to length, infinite for nonterminals that derive no terminal string,
+    dict from each nonterminal with a finite length to its production)
+    """
+    rules = list(g.iter_productions())
+    occurrences = {x: [] for x in g.nonterminals}  # (production, number of times x appears in it)
+    pending = []  # Number of distinct nonterminals of each production that aren't settled
+    partial = []  # Length of each production, counting only terminals and settled nonterminals
+    heap = []
+
+    for i, r in enumerate(rules):
+        counts = {}
+        n = 0
+        for s in r.body:
+            if s in occurrences:
+                counts[s] = counts.get(s, 0) + 1
+            elif s != g.epsilon:
+                n += 1
+        for s, c in counts.items():
+            occurrences[s].append((i, c))
+        pending.append(len(counts))
+        partial.append(n)
+        if not counts:
+            heapq.heappush(heap, (n, i))
+
+    lengths = {x: INFINITY for x in g.nonterminals}
+    shortest = {}
+    while heap:
+        n, i = heapq.heappop(heap)
+        x = rules[i].head
+        if x in shortest:
+            continue
+        shortest[x] = rules[i]
+        lengths[x] = n
+        for j, c in occurrences[x]:
+            partial[j] += n * c
+            pending[j] -= 1
+            if pending[j] == 0 and rules[j].head not in shortest:
+                heapq.heappush(heap, (partial[j], j))
+
+    return lengths, shortest
+
+
+class SentenceGenerator:
+    """
+    Sample random sentences of a grammar.
+    Derivations are expanded with an explicit stack, so deep derivations don't hit the recursion limit.
+    """
+
+    def __init__(self, g, rng=None):
+        """
+        :param g: input grammar
+        :param rng: random.Random instance, for reproducible output
+        """
+        self.start = g.start
+        self.rng = rng or random.Random()
+        self.lengths, shortest = shortest_derivations(g)
+        if self.lengths.get(g.start, INFINITY) == INFINITY:
+            raise InvalidGrammar("Start symbol doesn't derive any terminal string", str(g))
+
+        # For each nonterminal, its productions sorted by minimum length, and the one used once the budget is spent.
+        # Bodies are reversed and without ε, ready to push on the stack.
+        self.shortest = {x: tuple(s for s in reversed(r.body) if s != g.epsilon) for x, r in shortest.items()}
+        self.choices = {}
+        self.choice_lengths = {}
+        for x in g.nonterminals:
+            options = []
+            for p in g.productions[x]:
+                body = tuple(s for s in reversed(p.body) if s != g.epsilon)
+                n = sum(self.lengths.get(s, 1) for s in body)
+                if n != INFINITY:
+                    options.append((n, body))
+            options.sort(key=lambda o: o[0])
+            self.choices[x] = [body for n, body in options]
+            self.choice_lengths[x] = [n for n, body in options]
+
+    def tokens(self, max_length=None):
+        """
+        Generate the tokens of one sentence. Productions are chosen uniformly among those that fit in the budget;
+        once it is spent, each nonterminal is expanded with its production of the shortest derivation.
+        :param max_length: maximum number of tokens, DEFAULT_MAX_LENGTH if None. If it is shorter than the shortest
+        sentence, the shortest sentence is generated.
+        :return: iterable of terminals
+        """
+        choices = self.choices
+        choice_lengths = self.choice_lengths
+        shortest = self.shortest
+        lengths = self.lengths
+        randrange = self.rng.randrange
+        if max_length is None:
+            max_length = DEFAULT_MAX_LENGTH
+
+        stack = [self.start]
+        pending = lengths[self.start]  # Minimum number of tokens the stack will still produce
+        emitted = 0
+        expansions = max_length * EXPANSIONS_PER_TOKEN
+        while stack:
+            s = stack.pop()
+            if s not in choices:
+                emitted += 1
+                pending -= 1
+                yield s
+                continue
+
+            pending -= lengths[s]
+            room = max_length - emitted - pending
+            expansions -= 1
+            if expansions < 0 or room <= lengths[s]:
+                pending += lengths[s]
+                stack.extend(shortest[s])
+                continue
+
+            # Only productions that still fit in the budget, the first one always does
+            i = randrange(bisect.bisect_right(choice_lengths[s], room))
+            pending += choice_lengths[s][i]
+            stack.extend(choices[s][i])
+
+    def sentences(self, count=None, max_length=None):
+        """
+        Generate sentences
+        :param count: number of sentences, unlimited if None
+        :return: iterable of lists of terminals
+        """
+        n = 0
+        while count is None or n < count:
+            yield list(self.tokens(max_length))
+            n += 1
+
+    def write(self, file, count, max_length=None, separator=' '):
+        """
+        Write one sentence per line
+        :param file: output file object
+        """
+        write = file.write
+        for sentence in self.sentences(count, max_length):
+            write(separator.join(sentence) + '\n')
@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 
+import hashlib
 import itertools
+import json
 from copy import copy
-from functools import lru_cache
-
-visited = set()
 
 
 class InvalidGrammar(Exception):
@@ -14,28 +13,105 @@ class InvalidGrammar(Exception):
         self.bnf_text = bnf_text
 
 
-class MemoHelper:
+DIGEST_MODULUS = 1 << 256
+
+
+def rule_digest(rule):
     """
-    Wrapper to ignore param previous in follow method
+    Strong digest of a production, as an int
+    :param rule: the production
+    :return: int in [0, DIGEST_MODULUS)
     """
+    data = json.dumps([rule.head, list(rule.body)], ensure_ascii=False).encode('utf-8')
+    return int.from_bytes(hashlib.sha256(data).digest(), 'big')
 
-    def __init__(self, seq=()):
-        self.tup = tuple(seq)
 
-    def __eq__(self, other):
-        return isinstance(self, type(other))
+# Analyses computed by Grammar.analysis and the analyses each one is built from.
+# An analysis is only valid while all its dependencies are.
+ANALYSES = OrderedDict([
+    ('terminal-index', ()),
+    ('first', ('terminal-index',)),
+    ('nullable', ('first',)),
+    ('follow', ('first',)),
+    ('left-corner', ('nullable',)),
+])
 
-    def __hash__(self):
-        return hash(type(self))
 
-    def __add__(self, seq=()):
-        return MemoHelper(self.tup + tuple(seq))
+def insert_entries(table, index, rule, lookahead, conflicts=0):
+    """
+    Add a production to the parsing table row of its head
+    :param index: TerminalIndex of the bitmasks
+    :param lookahead: bitmask of the terminals that select the production
+    :param conflicts: bitmask of the terminals already taken by other productions of the row
+    """
+    for i in index.ids_of(lookahead):
+        key = (rule.head, index.terminals[i])
+        if conflicts >> i & 1:
+            entry = table[key]
+            table[key] = (entry if isinstance(entry, list) else [entry]) + [rule]
+        else:
+            table[key] = rule
 
-    def __iter__(self):
-        return iter(self.tup)
+
+class Conflict(namedtuple('Conflict', ['nonterminal', 'terminals', 'rules'])):
+    """
+    Two productions of the same nonterminal competing for the same lookahead terminals
+    """
 
     def __str__(self):
-        return str(self.tup)
+        return "{} on {{{}}}: {}".format(self.nonterminal, ', '.join(self.terminals),
+                                         ' | '.join(str(r) for r in self.rules))
+
+
+class TerminalIndex:
+    """
+    Assign a bit position to each terminal so terminal sets can be stored as int bitmasks.
+    Union, difference and intersection of sets become |, & ~ and & over plain ints.
+    """
+
+    def __init__(self, terminals=()):
+        self.terminals = sorted(terminals)
+        self.ids = {t: i for i, t in enumerate(self.terminals)}
+
+    def bit(self, terminal):
+        """
+        Get the bitmask for a single terminal, registering it if it is unknown
+        :param terminal: the terminal
+        :return: int with only the terminal's bit set
+        """
+        try:
+            return 1 << self.ids[terminal]
+        except KeyError:
+            self.ids[terminal] = len(self.terminals)
+            self.terminals.append(terminal)
+            return 1 << self.ids[terminal]
+
+    def mask(self, terminals):
+        """
+        Convert an iterable of terminals to a bitmask
+        """
+        m = 0
+        for t in terminals:
+            m |= self.bit(t)
+        return m
+
+    def ids_of(self, mask):
+        """
+        Iterate over the terminal ids set in a bitmask, in ascending order
+        """
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def symbols(self, mask):
+        """
+        Convert a bitmask back to a sorted list of terminals
+        """
+        return sorted(self.terminals[i] for i in self.ids_of(mask))
+
+    def __len__(self):
+        return len(self.terminals)
 
 
 class Grammar:
@@ -44,6 +120,10 @@ class Grammar:
         self.start = start
         self.epsilon = epsilon
         self.eof = eof
+        self.inline = set()  # Nonterminals for EBNF groups, options and repetitions, see parse_bnf
+        self.__rules_digest = 0
+        for r in self.iter_productions():
+            self.__rules_digest = (self.__rules_digest + rule_digest(r)) % DIGEST_MODULUS
         self.__clear_cache()
 
     @property
@@ -71,17 +151,31 @@ class Grammar:
     def add_rule(self, rule):
         try:
             current_productions = self.productions[rule.head]
-            if rule not in current_productions:
-                current_productions.append(rule)
+            if rule in current_productions:
+                return
+            current_productions.append(rule)
         except KeyError:
             self.productions[rule.head] = [rule]
-        finally:
-            self.__clear_cache()
+
+        self.__rules_digest = (self.__rules_digest + rule_digest(rule)) % DIGEST_MODULUS
+        self.__clear_cache()
 
     def remove_rule(self, rule):
         self.productions[rule.head].remove(rule)
+        self.__rules_digest = (self.__rules_digest - rule_digest(rule)) % DIGEST_MODULUS
         self.__clear_cache()
 
+    @property
+    def fingerprint(self):
+        """
+        Canonical digest of the grammar: productions (in any order), start symbol, epsilon and EOF.
+        The productions part is a sum of rule digests kept up to date by add_rule and remove_rule,
+        so computing the fingerprint doesn't depend on the size of the grammar.
+        :return: hex string
+        """
+        data = json.dumps([self.start, self.epsilon, self.eof, self.__rules_digest], ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
     def is_terminal(self, s):
         return s not in self.nonterminals
 
@@ -96,25 +190,24 @@ class Grammar:
         """
         return [p.body for p in self.productions[a]]
 
+    @property
+    def terminal_index(self):
+        """
+        Bit positions assigned to every terminal of the grammar, EOF included
+        :return: TerminalIndex
+        """
+        return self.analysis('terminal-index')
+
     def first(self, x):
         """
         Compute FIRST(X)
         1- If X is a terminal, FIRST(X) = {X}
         2- If there exists a production X -> ε, FIRST(X) = {ε}
         3- If there exists a production X -> Y1Y2...Yk, FIRST(X) = {Y1Y2...Yk}
-        :param x:
-        :return: FIRST set
+        :param x: a symbol or a tuple of symbols
+        :return: FIRST set as a sorted list
         """
-        f = set()
-        if isinstance(x, tuple):
-            f = self.first_multiple(x)
-        elif self.is_terminal(x):
-            f = {x}  # Rule 1 and 2
-        else:
-            for p in self.productions_for(x):
-                f = f.union(self.first(p))
-
-        return sorted(f)
+        return self.terminal_index.symbols(self.first_mask(x))
 
     def first_multiple(self, tokens):
         """
@@ -122,21 +215,23 @@ class Grammar:
         :param tokens: list of symbols
         :return: FIRST set
         """
-        f = set()
+        return set(self.first(tuple(tokens)))
 
-        for t in tokens:
-            ft = self.first(t)
-            f = f.union(ft)
-            if self.epsilon not in ft:
-                break
+    def first_mask(self, x):
+        """
+        Compute FIRST(X) as a bitmask over terminal_index
+        :param x: a symbol or a tuple of symbols
+        :return: int bitmask
+        """
+        first_sets = self.analysis('first')
+        if not isinstance(x, tuple):
+            x = (x,)
 
-        return f
+        return self.__first_of_body(x, first_sets)
 
-    @lru_cache(maxsize=20)
-    def follow(self, nonterminal, previous=MemoHelper()):
+    def follow(self, nonterminal):
         """
         Compute FOLLOW(A)
-        :param previous: track previous nonterminals
         :param nonterminal: the nonterminal A
         :return: set of terminals that can appear immediately to the right of A in some partial derivation
 
@@ -144,37 +239,189 @@ class Grammar:
         2.a For each production X -> aAb, if ε is in FIRST(b) then put FOLLOW(X) into FOLLOW(A)
         2.b For each production X -> aA, put FOLLOW(X) into FOLLOW(A)
         """
-        previous += (nonterminal,)
+        return self.terminal_index.symbols(self.follow_mask(nonterminal))
 
-        f = set()
-        if self.is_start_symbol(nonterminal):
-            f.add(self.eof)
+    def follow_mask(self, nonterminal):
+        """
+        Compute FOLLOW(A) as a bitmask over terminal_index
+        :param nonterminal: the nonterminal A
+        :return: int bitmask
+        """
+        return self.analysis('follow').get(nonterminal, 0)
 
-        subsets = set()
-        for p in self.iter_productions():
-            if nonterminal in p.body:
-                position = p.body.index(nonterminal)
-                a = p.body[0:position] # a can be any string, even empty
-                b = p.body[position + 1:]
+    def predict_mask(self, rule):
+        """
+        Lookahead terminals that select a production in the parsing table:
+        FIRST(body) − {ε}, plus FOLLOW(head) if the body can derive ε
+        :param rule: the production
+        :return: int bitmask
+        """
+        eps = self.terminal_index.bit(self.epsilon)
+        first = self.first_mask(rule.body)
+        if first & eps:
+            return (first & ~eps) | self.follow_mask(rule.head)
+
+        return first
+
+    def __first_of_body(self, body, first_sets):
+        index = self.terminal_index
+        eps = index.bit(self.epsilon)
+        f = 0
+        for symbol in body:
+            fs = first_sets[symbol] if symbol in first_sets else index.bit(symbol)
+            f |= fs & ~eps
+            if not fs & eps:
+                return f
+
+        return f | eps  # Every symbol can derive ε
+
+    def analysis(self, name):
+        """
+        Get the result of an analysis, computing it the first time it is requested.
+        Results are discarded when a rule is added or removed.
+        :param name: one of ANALYSES keys
+        :return: the analysis result
+        """
+        try:
+            return self.analyses[name]
+        except KeyError:
+            compute = {
+                'terminal-index': self.__terminal_index,
+                'first': self.__first_sets,
+                'nullable': self.__nullable,
+                'follow': self.__follow_sets,
+                'left-corner': self.__left_corners,
+            }[name]
+            result = self.analyses[name] = compute()
+            return result
+
+    def keep_analyses(self, other, preserved):
+        """
+        Reuse analyses computed for another grammar that are still valid for this one
+        :param other: grammar the analyses were computed for
+        :param preserved: names of the analyses that are still valid
+        """
+        for name, dependencies in ANALYSES.items():
+            if name in self.analyses or name not in preserved or name not in other.analyses:
+                continue
+            # Results refer to their dependencies (e.g. bitmasks to a terminal index), so those must be shared too.
+            # Dependencies come first in ANALYSES, so they are already decided.
+            if all(d in other.analyses and self.analyses.get(d) is other.analyses[d] for d in dependencies):
+                self.analyses[name] = other.analyses[name]
+
+    def keep_inline(self, other):
+        """
+        Keep the EBNF nonterminals of another grammar, and those created from them by adding primes
+        :param other: grammar this one was transformed from
+        """
+        self.inline = {x for x in self.nonterminals if x.rstrip("'") in other.inline}
 
-                # Case 1
-                if b:
-                    f = f.union(set(self.first(b)) - {self.epsilon})
+    def __terminal_index(self):
+        return TerminalIndex(set(self.terminals) | {self.epsilon, self.eof})
 
-                # Case 2.a (Cases 1 and 2 aren't mutually exclusive)
-                if not b:
-                    subsets.add(p.head)
-                # Case 2.b
-                elif b and self.epsilon in self.first(b):
-                    subsets.add(p.head)
+    def __first_sets(self):
+        """
+        Compute FIRST for every nonterminal with a fixed-point iteration
+        """
+        first_sets = {x: 0 for x in self.nonterminals}
+        changed = True
+        while changed:
+            changed = False
+            for p in self.iter_productions():
+                f = first_sets[p.head] | self.__first_of_body(p.body, first_sets)
+                if f != first_sets[p.head]:
+                    first_sets[p.head] = f
+                    changed = True
+
+        return first_sets
+
+    def __nullable(self):
+        """
+        Nonterminals that derive ε
+        """
+        eps = self.terminal_index.bit(self.epsilon)
+        return {x for x, f in self.analysis('first').items() if f & eps}
 
-        subsets = subsets - {nonterminal}
+    def __follow_sets(self):
+        """
+        Compute FOLLOW for every nonterminal with a fixed-point iteration
+        """
+        first_sets = self.analysis('first')
+        eps = self.terminal_index.bit(self.epsilon)
+        follow_sets = {x: 0 for x in self.nonterminals}
+        if self.start in follow_sets:
+            follow_sets[self.start] = self.terminal_index.bit(self.eof)
+
+        # FIRST(b) only depends on the production, so it is computed once per position
+        edges = []
+        for p in self.iter_productions():
+            for position, symbol in enumerate(p.body):
+                if symbol not in follow_sets:
+                    continue
+                f = self.__first_of_body(p.body[position + 1:], first_sets)
+                follow_sets[symbol] |= f & ~eps  # Case 1
+                if f & eps and p.head != symbol:
+                    edges.append((p.head, symbol))  # Cases 2.a and 2.b
+
+        changed = True
+        while changed:
+            changed = False
+            for x, a in edges:
+                f = follow_sets[a] | follow_sets[x]
+                if f != follow_sets[a]:
+                    follow_sets[a] = f
+                    changed = True
+
+        return follow_sets
+
+    def __left_corners(self):
+        """
+        Left-corner graph: A -> B if there is a production A -> a B b where a derives ε
+        :return: dict from each nonterminal to the set of its direct left corners
+        """
+        nullable = self.analysis('nullable')
+        corners = {x: set() for x in self.nonterminals}
+        for p in self.iter_productions():
+            for symbol in p.body:
+                if symbol not in corners:
+                    break
+                corners[p.head].add(symbol)
+                if symbol not in nullable:
+                    break
 
-        for x in subsets:
-            if x not in previous:
-                f = f.union(self.follow(x, previous))
+        return corners
 
-        return sorted(f)
+    def check_ll1(self, collect_all=False):
+        """
+        Check the LL(1) condition without building the parsing table.
+        For each pair of productions A -> a | b, the lookahead sets predict(a) and predict(b) must be disjoint.
+        :param collect_all: If False, stop at the first conflict found.
+        :return: list of conflicts, empty if the grammar is LL(1)
+        """
+        index = self.terminal_index
+        conflicts = []
+        for x in self.nonterminals:
+            rules = self.productions[x]
+            masks = [self.predict_mask(r) for r in rules]
+            seen = 0
+            for j, m in enumerate(masks):
+                if seen & m:
+                    for i in range(j):
+                        common = masks[i] & m
+                        if common:
+                            conflicts.append(Conflict(x, index.symbols(common), (rules[i], rules[j])))
+                            if not collect_all:
+                                return conflicts
+                seen |= m
+
+        return conflicts
+
+    def is_ll1(self):
+        """
+        Check if the grammar is LL(1), stopping at the first conflict
+        :return: True if the grammar is LL(1), False otherwise
+        """
+        return not self.check_ll1()
 
     def parsing_table(self, is_clean=True):
         """
@@ -186,33 +433,17 @@ class Grammar:
 
         equiv = self if is_clean else remove_left_recursion(remove_left_factoring(copy(self)))
 
+        index = equiv.terminal_index
         table = {}
         ambigous = False
-        for r in equiv.iter_productions():
-            terminals = equiv.first(r.body)
-            for t in terminals:
-                if not equiv.is_terminal(t):
-                    continue
-                if t == equiv.epsilon:
-                    f = equiv.follow(r.head)
-                    for ef in f:
-                        if (table.get((r.head, ef))):
-                            ls = []
-                            ls.append(table[(r.head, ef)])
-                            ls.append(r)
-                            table[(r.head, ef)] = ls
-                            ambigous = True
-                        else:
-                            table[(r.head, ef)] = r
-                else:
-                    if (table.get((r.head, t))):
-                        ls = []
-                        ls.append(table[(r.head, t)])
-                        ls.append(r)
-                        table[(r.head, t)] = ls
-                        ambigous = True
-                    else:
-                        table[(r.head, t)] = r
+        for x in equiv.nonterminals:
+            seen = 0
+            for r in equiv.productions[x]:
+                lookahead = equiv.predict_mask(r)
+                conflicts = seen & lookahead
+                seen |= lookahead
+                insert_entries(table, index, r, lookahead, conflicts)
+                ambigous = ambigous or bool(conflicts)
         return (table, ambigous)
 
     def print_join_productions(self):
@@ -223,7 +454,7 @@ class Grammar:
         return s
 
     def __clear_cache(self):
-        self.follow.cache_clear()
+        self.analyses = {}
 
     def __str__(self):
         prod_strings = []
@@ -237,15 +468,17 @@ class Grammar:
         return '\n'.join([str(p) for p in self.iter_productions()])
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Grammar) and self.fingerprint == other.fingerprint
 
     def __hash__(self):
-        strings = tuple(sorted([str(p) for p in self.iter_productions()]))
-        return hash(strings)
+        return hash(self.fingerprint)
 
     def __copy__(self):
         g = Grammar(start=self.start, epsilon=self.epsilon, eof=self.eof)
         for h, b in self.productions.items():
             g.productions[h] = copy(b)
+        g.__rules_digest = self.__rules_digest
+        g.inline = set(self.inline)
+        g.analyses = dict(self.analyses)  # Same productions, same analyses
 
         return g
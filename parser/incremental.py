@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of edited text.
+
+Tokens are separated by whitespace. Every node of the tree knows how many tokens it spans and how many characters,
+counting the whitespace before each token, so the tokens touched by an edit are found by walking down the tree.
+
+After an edit, only the smallest subtree that encloses the damaged tokens, and starts before them, is parsed again.
+LL(1) parsing is deterministic: a nonterminal expanded at a given token always derives the same subtree as long as
+its tokens and the lookahead token after them are the same. So old subtrees that satisfy that are reused as they are,
+and if the new subtree ends at the same token as the old one the rest of the tree is still valid. Otherwise its
+parent is tried, up to the root.
+"""
+import re
+from collections import namedtuple
+
+from parser.runtime import NO_RULE, Node, ParseError
+
+TOKEN = re.compile(r'\S+')
+
+
+class Edit(namedtuple('Edit', ['start', 'end', 'text'])):
+    """
+    Replace the characters in [start, end) with text
+    """
+
+
+class SpanNode(Node):
+    """
+    Node with the number of tokens it spans (length) and their width in characters, including the whitespace
+    before each token (width)
+    """
+    __slots__ = ('length', 'width')
+
+    def __init__(self, symbol, children=None, length=0, width=0):
+        super().__init__(symbol, children)
+        self.length = length
+        self.width = width
+
+    def __reduce__(self):
+        return SpanNode, (self.symbol, self.children, self.length, self.width)
+
+
+def apply_edits(text, edits):
+    """
+    Apply edits one after the other, each one relative to the text left by the previous ones
+    :param edits: iterable of Edit or (start, end, text) tuples
+    :return: (new text, single Edit of the original text with the same effect)
+    """
+    original = len(text)
+    low = high = None  # Changed region in the current text
+    for start, end, replacement in edits:
+        if not 0 <= start <= end <= len(text):
+            raise ValueError("Edit out of range: {}".format((start, end)))
+        text = text[:start] + replacement + text[end:]
+        delta = len(replacement) - (end - start)
+        if low is None:
+            low, high = start, start + len(replacement)
+        else:
+            # Points after the edit move, points inside it end up at the end of the replacement
+            moved = high if high <= start else high + delta if high >= end else start + len(replacement)
+            low, high = min(low, start), max(moved, start + len(replacement))
+
+    if low is None:
+        return text, Edit(0, 0, '')
+    return text, Edit(low, high - (len(text) - original), text[low:high])
+
+
+def _lex(text, start, end):
+    """
+    :return: (whitespace before, token) of each token in text[start:end]
+    """
+    tokens = []
+    previous = start
+    for m in TOKEN.finditer(text, start, end):
+        tokens.append((m.start() - previous, m.group()))
+        previous = m.end()
+    return tokens
+
+
+def _find_leaf(root, offset, last=False):
+    """
+    Find a token from a character offset. The span of a token goes from the end of the previous one to its end.
+    :param last: find the last token whose span starts at or before offset, instead of the first one whose span
+    ends at or after offset
+    :return: (token number, start of its span, end of its span)
+    """
+    node, token, char = root, 0, 0
+    while not node.is_leaf():
+        chosen = None
+        for child in node.children:
+            if child.length:
+                if last and char > offset:
+                    break
+                chosen = child, token, char
+                if not last and char + child.width >= offset:
+                    break
+            token += child.length
+            char += child.width
+        node, token, char = chosen
+
+    return token, char, char + node.width
+
+
+def _node_at(root, start, position, symbol):
+    """
+    Find the outermost node of a nonterminal starting at a token, inside a subtree
+    :param start: first token of root
+    :return: the node or None
+    """
+    node, token = root, start
+    while True:
+        for child in node.children:
+            if token == position and child.symbol == symbol and not child.is_leaf():
+                return child
+            if token <= position < token + child.length and not child.is_leaf():
+                node = child
+                break
+            if token > position:
+                return None
+            token += child.length
+        else:
+            return None
+
+
+class IncrementalParser:
+    def __init__(self, table):
+        """
+        :param table: CompiledTable
+        """
+        self.table = table
+        self.nonterminals = {s: i for i, s in enumerate(table.symbols) if i >= table.width}
+        self.error = None
+        self.created = 0  # Nodes created by the last parse or reparse
+        self.reused = 0  # Subtrees reused by the last reparse
+
+    def parse(self, text):
+        """
+        Parse a whole text
+        :return: root SpanNode
+        :raise ParseError: if text is not a sentence of the grammar
+        """
+        self.created = self.reused = 0
+        return self.__parse(self.table.start, text, 0, 0)
+
+    def reparse(self, text, tree, edits):
+        """
+        Parse an edited text reusing the tree of the text before the edits
+        :param text: text before the edits
+        :param tree: tree of text, or None if it had syntax errors
+        :param edits: list of Edit, applied in order
+        :return: (edited text, its tree). The tree is None if the edited text has syntax errors, see self.error
+        """
+        new_text, edit = apply_edits(text, edits)
+        self.error = None
+        try:
+            if tree is None:
+                return new_text, self.parse(new_text)
+            return new_text, self.__reparse(tree, text, new_text, edit)
+        except ParseError as e:
+            self.error = e
+            return new_text, None
+
+    def __reparse(self, tree, old_text, text, edit):
+        if tree.length == 0:
+            return self.parse(text)
+        self.created = self.reused = 0
+        delta = len(edit.text) - (edit.end - edit.start)
+
+        # Tokens whose span touches the edit, and the characters they cover
+        if edit.start > tree.width:
+            first, low = tree.length, tree.width
+        else:
+            first, low, _ = _find_leaf(tree, edit.start)
+        if edit.end > tree.width:
+            last, high = tree.length, len(old_text)
+        else:
+            last, _, high = _find_leaf(tree, edit.end, last=True)
+            last += 1
+        old = _lex(old_text, low, high)
+        new = _lex(text, low, high + delta)
+
+        # Leave out the tokens at both ends that didn't change
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        first += prefix
+        last -= suffix
+        shift = len(new) - len(old)
+        if old == new:
+            return tree  # Only whitespace after the last token changed
+
+        # Nodes from the root to the innermost one that starts before the damaged tokens and ends after them
+        path = []  # (node, first token, first character, index of the next node on the path)
+        node, token, char = tree, 0, 0
+        while node is not None:
+            start = token, char
+            index = None
+            for i, child in enumerate(node.children):
+                if not child.is_leaf() and token < first and token + child.length >= last:
+                    index = i
+                    break
+                token += child.length
+                char += child.width
+            path.append((node, start[0], start[1], index))
+            node = node.children[index] if index is not None else None
+
+        for depth in range(len(path) - 1, -1, -1):
+            node, token, char, _ = path[depth]
+            try:
+                subtree = self.__parse(self.nonterminals[node.symbol], text, char, token,
+                                       token + node.length + shift if depth else None,
+                                       self.__reuse(node, token, first, last, shift))
+                break
+            except ParseError:
+                if not depth:
+                    raise
+
+        for parent, _, _, i in reversed(path[:depth]):
+            children = list(parent.children)
+            children[i] = subtree
+            subtree = SpanNode(parent.symbol, children, parent.length + shift,
+                               parent.width - parent.children[i].width + subtree.width)
+
+        return subtree
+
+    def __reuse(self, node, start, first, last, shift):
+        """
+        :param node: old subtree being parsed again, starting at token start
+        :param first: first damaged token
+        :param last: first token after the damaged ones, before the edit
+        :param shift: number of tokens added by the edit
+        :return: function (symbol, token) -> old subtree for symbol at that token of the new text, or None
+        """
+        def reuse(symbol, position):
+            if position < first:
+                q = position
+            elif position >= last + shift:
+                q = position - shift
+            else:
+                return None
+            old = _node_at(node, start, q, symbol)
+            if old is None or q < first <= q + old.length:
+                return None  # Its tokens or the lookahead after them changed
+            return old
+
+        return reuse
+
+    def __parse(self, symbol, text, char, position, end=None, reuse=None):
+        """
+        Parse a nonterminal
+        :param symbol: number of the nonterminal
+        :param char: character where the span of its first token starts
+        :param position: number of its first token
+        :param end: token where it must end, or None if it must reach the end of the text
+        :param reuse: function that gives old subtrees that can be reused, see __reuse
+        :return: SpanNode
+        """
+        table = self.table
+        symbols = table.symbols
+        width = table.width
+        stride = table.stride
+        columns = table.columns
+        actions = table.actions
+        bodies = table.bodies
+        ids = table.ids
+
+        def lookahead():
+            if match is None:
+                return table.eof
+            t = ids.get(match.group())
+            if t is None:
+                raise ParseError("Unknown token {} at position {}".format(match.group(), position), position)
+            return t
+
+        lexer = TOKEN.finditer(text, char)
+        match = next(lexer, None)
+        current = lookahead()
+        created = []
+        top = []
+        stack = [(symbol, top)]
+        while stack:
+            s, siblings = stack.pop()
+            if s < width:
+                if s != current:
+                    raise ParseError("Expected {} at position {}, found {}".format(
+                        symbols[s], position, symbols[current]), position)
+                siblings.append(SpanNode(symbols[s], None, 1, match.end() - char))
+                char = match.end()
+                position += 1
+                if end is not None and position > end:
+                    raise ParseError("Subtree doesn't end at token {}".format(end), position)
+                match = next(lexer, None)
+                current = lookahead()
+                continue
+
+            old = reuse(symbols[s], position) if reuse else None
+            if old is not None:
+                siblings.append(old)
+                self.reused += 1
+                char += old.width
+                position += old.length
+                lexer = TOKEN.finditer(text, char)
+                match = next(lexer, None)
+                current = lookahead()
+                continue
+
+            r = actions[(s - width) * stride + columns[current]]
+            if r == NO_RULE:
+                raise ParseError("Unexpected {} at position {}, expected one of: {}".format(
+                    symbols[current], position, ', '.join(table.expected(s))), position)
+            node = SpanNode(symbols[s], [])
+            siblings.append(node)
+            created.append(node)
+            for c in bodies[r]:
+                stack.append((c, node.children))
+
+        if end is None and current != table.eof:
+            raise ParseError("Expected end of input at position {}, found {}".format(
+                position, symbols[current]), position)
+        if end is not None and position != end:
+            raise ParseError("Subtree doesn't end at token {}".format(end), position)
+
+        # Children are created after their parents
+        for node in reversed(created):
+            node.length = sum(c.length for c in node.children)
+            node.width = sum(c.width for c in node.children)
+        self.created += len(created)
+
+        return top[0]
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Counters and histograms in the Prometheus text format.
+
+Updates take a lock per metric and touch a dict entry, so they are cheap and safe from several threads. A server
+running several worker processes gives each one a Registry with the same directory: every process writes a snapshot
+of its metrics there, at most once per interval, and the process that answers a scrape adds up all the snapshots.
+Snapshots of processes that exited are added to a single file and removed, so counts don't go back and the directory
+doesn't grow with every worker ever started. The processes must run on the same host.
+"""
+import bisect
+import fcntl
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+EXITED = 'exited'  # Snapshot with the metrics of the processes that exited
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Process of another user
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(n, _escape(v)) for n, v in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        """
+        :param labels: names of the labels, values are given when the metric is updated
+        :param registry: Registry notified after each update
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{} has labels {}, got {}".format(self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def changed(self):
+        if self.registry is not None:
+            self.registry.changed()
+
+    def snapshot(self):
+        with self.lock:
+            return {k: self.copy(v) for k, v in self.values.items()}
+
+    @staticmethod
+    def copy(value):
+        return value
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.changed()
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name + _labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), registry=None, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One count per bucket and one for +Inf, not cumulative, then the sum of the observed values
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0]
+            counts[i] += 1
+            counts[-1] += value
+        self.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the time spent in a with block, in seconds
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def copy(value):
+        return list(value)
+
+    @staticmethod
+    def add(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def samples(self, values):
+        for key, counts in sorted(values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                total += count
+                yield self.name + '_bucket' + _labels(self.labelnames, key, [('le', _number(bound))]), total
+            yield self.name + '_sum' + _labels(self.labelnames, key), counts[-1]
+            yield self.name + '_count' + _labels(self.labelnames, key), total
+
+
+class Registry:
+    def __init__(self, directory=None, interval=1.0):
+        """
+        :param directory: where worker processes share their metrics, None for a single process
+        :param interval: minimum seconds between two snapshots written to directory
+        """
+        self.metrics = OrderedDict()
+        self.directory = directory
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def register(self, metric):
+        metric.registry = self
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets=buckets))
+
+    def snapshot(self):
+        """
+        :return: values of every metric, keyed by metric name and label values
+        """
+        return {name: m.snapshot() for name, m in self.metrics.items()}
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, 'metrics-{}.json'.format(pid or os.getpid()))
+
+    def changed(self):
+        """
+        Schedule a snapshot, changes made before it is written go in the same snapshot
+        """
+        if self.directory is None:
+            return
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.interval, self.write)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def write(self):
+        """
+        Write the snapshot of this process to the shared directory
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()  # This snapshot includes its changes
+                self.timer = None
+        self.dump(self.snapshot(), self.path())
+
+    def dump(self, totals, path):
+        """
+        Replace the file at path with a snapshot, atomically
+        """
+        data = {name: [[list(k), v] for k, v in values.items()] for name, values in totals.items()}
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def add(self, totals, path):
+        """
+        Add the snapshot at path to totals, if it can be read
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # Being replaced, or already removed
+        for metric, values in data.items():
+            if metric not in self.metrics:
+                continue
+            add = self.metrics[metric].add
+            current = totals[metric]
+            for key, value in values:
+                key = tuple(key)
+                current[key] = add(current[key], value) if key in current else value
+
+    @contextmanager
+    def locked(self, operation):
+        """
+        Hold the lock of the shared directory in a with block
+        :param operation: fcntl.LOCK_EX to change the snapshots of other processes, fcntl.LOCK_SH to read them
+        """
+        with open(os.path.join(self.directory, '.metrics.lock'), 'a') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def prune(self):
+        """
+        Add the snapshots of the processes that exited to the EXITED snapshot and remove them
+        """
+        stale = []
+        for name in os.listdir(self.directory):
+            pid = name[len('metrics-'):-len('.json')]
+            if name.startswith('metrics-') and name.endswith('.json') and pid.isdigit() and not _alive(int(pid)):
+                stale.append(os.path.join(self.directory, name))
+        if not stale:
+            return
+
+        with self.locked(fcntl.LOCK_EX):  # Another process may be removing the same snapshots
+            stale = [path for path in stale if os.path.exists(path)]
+            if not stale:
+                return
+            exited = self.path(EXITED)
+            totals = {name: {} for name in self.metrics}
+            for path in [exited] + stale:
+                self.add(totals, path)
+            self.dump(totals, exited)
+            for path in stale:
+                os.unlink(path)
+
+    def collect(self):
+        """
+        :return: snapshot of this process plus the last snapshots of the other processes sharing the directory
+        """
+        totals = self.snapshot()
+        if self.directory is None:
+            return totals
+
+        self.prune()
+        own = self.path()
+        # A snapshot being folded is in EXITED before it's removed, so don't read while another process prunes
+        with self.locked(fcntl.LOCK_SH):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith('metrics-') and name.endswith('.json') and path != own:
+                    self.add(totals, path)
+
+        return totals
+
+    def expose(self):
+        """
+        :return: every metric in the Prometheus text format
+        """
+        totals = self.collect()
+        lines = []
+        for name, m in self.metrics.items():
+            lines.append('# HELP {} {}'.format(name, m.documentation.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(name, m.kind))
+            for sample, value in m.samples(totals[name]):
+                lines.append('{} {}'.format(sample, _number(value)))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Make a compiled parsing table smaller.
+
+Removing left recursion and left factors adds primed nonterminals, and many of them end up with the same row as
+another one. Two nonterminals are equivalent if, for every lookahead terminal, both reject it or both expand to
+bodies that are the same except for equivalent nonterminals. The coarsest such partition is found by refinement:
+start with one class for the nonterminals of EBNF operators and one for the rest, split the classes by their rows
+written with class numbers, and repeat until no class splits. Each class is kept as a single nonterminal with a
+single row.
+
+Terminals whose columns are the same in every row then share a column, and CompiledTable.columns maps each
+terminal to it.
+"""
+import array
+from collections import OrderedDict, namedtuple
+
+from parser.runtime import NO_RULE, CompiledTable
+
+
+class Reduction(namedtuple('Reduction', ['nonterminals', 'columns', 'before', 'after'])):
+    """
+    What minimize merged.
+    nonterminals maps each merged nonterminal to the one kept in its place, columns maps each terminal that
+    shares the column of an earlier terminal to that terminal. before and after are (rows, columns) of the table.
+    """
+
+    @property
+    def entries(self):
+        """
+        :return: (entries before, entries after)
+        """
+        return self.before[0] * self.before[1], self.after[0] * self.after[1]
+
+    def __str__(self):
+        before, after = self.entries
+        lines = ["{} x {} -> {} x {} ({} -> {} entries, {} -> {} bytes)".format(
+            self.before[0], self.before[1], self.after[0], self.after[1], before, after,
+            before * array.array('i').itemsize, after * array.array('i').itemsize)]
+        if self.nonterminals:
+            lines.append("Merged nonterminals: {}".format(
+                ', '.join('{} = {}'.format(x, y) for x, y in self.nonterminals.items())))
+        if self.columns:
+            lines.append("Shared columns: {}".format(
+                ', '.join('{} = {}'.format(x, y) for x, y in self.columns.items())))
+        return '\n'.join(lines)
+
+
+def equivalent_nonterminals(table):
+    """
+    :param table: CompiledTable
+    :return: class number of each nonterminal, indexed by symbol number minus table.width.
+    Classes are numbered in order of their first nonterminal.
+    """
+    width = table.width
+    count = len(table.symbols) - width
+    rows = [[table.actions[x * table.stride + table.columns[t]] for t in range(width)] for x in range(count)]
+
+    # Nonterminals of EBNF operators don't make nodes, so they are only equivalent to each other
+    classes = [int(width + x in table.inline) for x in range(count)]
+    total = None
+    while True:
+        def body(r):
+            return tuple(s if s < width else width + classes[s - width] for s in table.rules[r][1])
+
+        signatures = OrderedDict()
+        refined = [signatures.setdefault((classes[x], tuple(body(r) if r != NO_RULE else None for r in rows[x])),
+                                         len(signatures))
+                   for x in range(count)]
+        if len(signatures) == total:
+            return refined
+        classes, total = refined, len(signatures)
+
+
+def minimize(table):
+    """
+    Merge equivalent nonterminals and terminals with the same column
+    :param table: CompiledTable
+    :return: (minimized CompiledTable, Reduction). Parse trees of the minimized table name each merged
+    nonterminal after the one kept in its place.
+    """
+    width = table.width
+    count = len(table.symbols) - width
+    classes = equivalent_nonterminals(table)
+
+    # The first nonterminal of each class stands for it, except for the class of the start symbol
+    kept = {}
+    for x in range(count):
+        kept.setdefault(classes[x], width + x)
+    kept[classes[table.start - width]] = table.start
+    numbers = {s: width + i for i, s in enumerate(sorted(kept.values()))}
+
+    def renumber(s):
+        return s if s < width else numbers[kept[classes[s - width]]]
+
+    rules = []
+    rule_numbers = {}
+    for head, body in table.rules:
+        if head in numbers:
+            rule_numbers[(head, body)] = len(rules)
+            rules.append((numbers[head], tuple(renumber(s) for s in body)))
+
+    rows = []
+    for s in sorted(numbers):
+        row = [table.actions[(s - width) * table.stride + table.columns[t]] for t in range(width)]
+        rows.append([rule_numbers[table.rules[r]] if r != NO_RULE else NO_RULE for r in row])
+
+    # Terminals with the same column everywhere share it
+    shared = OrderedDict()
+    columns = [shared.setdefault(tuple(row[t] for row in rows), len(shared)) for t in range(width)]
+    actions = array.array('i', [NO_RULE]) * (len(rows) * len(shared))
+    for i, row in enumerate(rows):
+        for t in range(width):
+            actions[i * len(shared) + columns[t]] = row[t]
+
+    symbols = table.symbols[:width] + [table.symbols[s] for s in sorted(numbers)]
+    minimized = CompiledTable(symbols, width, numbers[table.start], rules, actions,
+                              [numbers[s] for s in table.inline if s in numbers], columns)
+
+    merged = OrderedDict((table.symbols[width + x], table.symbols[kept[classes[x]]])
+                         for x in range(count) if kept[classes[x]] != width + x)
+    first = {}
+    for t in range(width):
+        first.setdefault(columns[t], t)
+    same = OrderedDict((table.symbols[t], table.symbols[first[columns[t]]])
+                       for t in range(width) if first[columns[t]] != t)
+
+    return minimized, Reduction(merged, same, (count, table.stride), (len(rows), len(shared)))
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Grammars split into modules.
+
+A module is a BNF file that may include other modules with a line like:
+
+%include expressions.bnf
+
+Paths are relative to the including file. Each module is analysed on its own: its FIRST sets and the part of its
+parsing table rows that only depends on FIRST are stored in a ModuleCache, keyed by the module text and the FIRST
+sets of the nonterminals it uses from other modules. Linking only recomputes FOLLOW and the rows of nullable
+productions, which are the only parts that depend on other modules' productions.
+
+Like the other entry points, the linked grammar goes through the default pipeline. If it has left recursion or left
+factors, the pipeline changes it and the table of the new grammar is computed without the module analyses.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from parser.functions import parse_bnf
+from parser.grammar import Grammar, InvalidGrammar, TerminalIndex, insert_entries
+from parser.passes import default_pipeline
+from parser.rule import Rule
+
+INCLUDE = '%include'
+
+
+class Module:
+    def __init__(self, path, text, includes, rules):
+        self.path = path
+        self.text = text
+        self.includes = includes
+        self.rules = rules
+        self.nonterminals = []
+        for r in rules:
+            if r.head not in self.nonterminals:
+                self.nonterminals.append(r.head)
+        self.digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def externals(self, defined):
+        """
+        Nonterminals used by this module and defined in another one
+        :param defined: every nonterminal defined in the linked modules
+        """
+        local = set(self.nonterminals)
+        return sorted({s for r in self.rules for s in r.body if s in defined and s not in local})
+
+    def __repr__(self):
+        return 'Module({})'.format(repr(self.path))
+
+
+def parse_module(path, text, epsilon='ε', eof='$'):
+    """
+    Parse a module: %include lines and BNF productions
+    :return: a Module
+    """
+    includes = []
+    productions = []
+    for line in text.strip().split('\n'):
+        if line.startswith(INCLUDE):
+            name = line[len(INCLUDE):].strip()
+            if not name:
+                raise InvalidGrammar("Missing module name", text)
+            includes.append(os.path.normpath(os.path.join(os.path.dirname(path), name)))
+        elif line.strip():
+            productions.append(line)
+
+    rules = []
+    if productions:
+        rules = list(parse_bnf('\n'.join(productions), epsilon=epsilon, eof=eof).iter_productions())
+
+    return Module(path, text, includes, rules)
+
+
+def load_modules(path, epsilon='ε', eof='$'):
+    """
+    Load a module and every module it includes, directly or not
+    :param path: main module
+    :return: list of modules, included modules before the modules including them. The main module is last.
+    """
+    modules = []
+    loaded = set()
+
+    def load(p):
+        p = os.path.normpath(p)
+        if p in loaded:
+            return
+        loaded.add(p)
+        with open(p, 'r') as f:
+            module = parse_module(p, f.read(), epsilon=epsilon, eof=eof)
+        for include in module.includes:
+            load(include)
+        modules.append(module)
+
+    load(path)
+    return modules
+
+
+class ModuleSummary:
+    """
+    Analysis results of a module that don't depend on how it is used
+
+    first: FIRST set of each nonterminal defined in the module
+    rows: for each production, FIRST(body) − {ε} and whether the body derives ε
+    """
+
+    def __init__(self, first, rows):
+        self.first = first
+        self.rows = rows
+
+    def to_json(self):
+        return {'first': self.first, 'rows': [[r.head, list(r.body), t, n] for r, t, n in self.rows]}
+
+    @staticmethod
+    def from_json(data):
+        return ModuleSummary(data['first'], [(Rule(h, tuple(b)), t, n) for h, b, t, n in data['rows']])
+
+
+class ModuleCache:
+    """
+    Module summaries, keyed by module text and the FIRST sets of its external nonterminals
+
+    used: keys of the summaries of the last linked grammar. Only those are saved, so the summaries of old versions
+    of the modules (and of the intermediate rounds of cyclic includes) don't pile up in the cache file.
+    """
+
+    def __init__(self):
+        self.summaries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(module, inputs, epsilon):
+        data = json.dumps([module.digest, epsilon, inputs], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def summary(self, module, inputs, epsilon):
+        """
+        Get the summary of a module, analysing it if it isn't cached
+        :param inputs: FIRST set of each external nonterminal used by the module
+        """
+        key = self.key(module, inputs, epsilon)
+        try:
+            summary = self.summaries[key]
+            self.hits += 1
+        except KeyError:
+            summary = self.summaries[key] = analyse_module(module, inputs, epsilon)
+            self.misses += 1
+
+        self.used.add(key)
+        return summary
+
+    def save(self, path):
+        """
+        Write the summaries used by the last link, or every summary if nothing was linked
+        """
+        keys = self.used or self.summaries.keys()
+        with open(path, 'w') as f:
+            json.dump({k: self.summaries[k].to_json() for k in keys}, f, ensure_ascii=False)
+
+    @staticmethod
+    def load(path):
+        cache = ModuleCache()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                cache.summaries = {k: ModuleSummary.from_json(s) for k, s in json.load(f).items()}
+        return cache
+
+
+def analyse_module(module, inputs, epsilon='ε'):
+    """
+    Compute FIRST sets and FOLLOW-independent table rows of a module
+    :param inputs: FIRST set of each external nonterminal used by the module
+    :return: ModuleSummary
+    """
+    productions = OrderedDict()
+    for r in module.rules:
+        productions.setdefault(r.head, []).append(r)
+    # External nonterminals are replaced by productions that derive exactly their FIRST sets
+    for x, first in inputs.items():
+        productions[x] = [Rule(x, (t,)) for t in first]
+    g = Grammar(productions, epsilon=epsilon)
+
+    first = {x: g.first(x) for x in module.nonterminals}
+    rows = []
+    for r in module.rules:
+        f = g.first(r.body)
+        rows.append((r, [t for t in f if t != epsilon], epsilon in f))
+
+    return ModuleSummary(first, rows)
+
+
+def link_modules(modules, epsilon='ε', eof='$', cache=None):
+    """
+    Link modules into one grammar, remove its left recursion and left factors, and compute its parsing table
+    :param modules: modules as returned by load_modules
+    :param cache: ModuleCache used to reuse the analysis of unchanged modules
+    :return: (grammar after the pipeline, parsing table, ambiguous)
+    """
+    cache = cache if cache is not None else ModuleCache()
+
+    defined = {}
+    for m in modules:
+        for x in m.nonterminals:
+            if x in defined:
+                raise InvalidGrammar("{} is defined in {} and {}".format(x, defined[x].path, m.path), m.text)
+            defined[x] = m
+
+    # Included modules come first, so without cyclic includes the second round only hits the cache
+    first = {}
+    summaries = {}
+    changed = True
+    while changed:
+        changed = False
+        # Only the summaries of the last round, where the FIRST sets are final, are kept
+        cache.used = set()
+        for m in modules:
+            inputs = {x: first.get(x, []) for x in m.externals(defined)}
+            summaries[m] = cache.summary(m, inputs, epsilon)
+            for x, f in summaries[m].first.items():
+                if first.get(x) != f:
+                    first[x] = f
+                    changed = True
+
+    main = modules[-1]
+    start = next((m.rules[0].head for m in [main] + modules if m.rules), None)
+    g = Grammar(start=start, epsilon=epsilon, eof=eof)
+    for m in [main] + modules[:-1]:
+        for r in m.rules:
+            g.add_rule(r)
+
+    # Reuse the FIRST sets of the modules, only FOLLOW is computed on the linked grammar
+    index = TerminalIndex(set(g.terminals) | {epsilon, eof})
+    g.analyses['terminal-index'] = index
+    g.analyses['first'] = {x: index.mask(f) for x, f in first.items()}
+
+    h = default_pipeline().run(g)
+    if h is not g:
+        table, ambiguous = h.parsing_table()
+        return h, table, ambiguous
+
+    table = {}
+    ambiguous = False
+    seen = {}
+    for m in modules:
+        for r, terminals, nullable in summaries[m].rows:
+            lookahead = index.mask(terminals)
+            if nullable:
+                lookahead |= g.follow_mask(r.head)
+            conflicts = seen.get(r.head, 0) & lookahead
+            seen[r.head] = seen.get(r.head, 0) | lookahead
+            insert_entries(table, index, r, lookahead, conflicts)
+            ambiguous = ambiguous or bool(conflicts)
+
+    return g, table, ambiguous
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Build the compiled parsing table of a large grammar with a pool of processes.
+
+The row of a nonterminal only depends on its productions and on the FIRST and FOLLOW sets, so those are computed
+once and every process gets them as plain ints when it starts. The rows are split in contiguous shards of about
+the same number of body symbols. Each process sends back the entries of its shard, as an int array of (position,
+rule) pairs, and the conflicts it finds. Tables are mostly empty, so the entries are much smaller than the rows, and
+the only full-size array is the table itself, filled in this process.
+"""
+import array
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from parser.grammar import Conflict
+from parser.render import table_terminals
+from parser.runtime import NO_RULE, CompiledTable
+
+_context = {}  # Analyses of the grammar, in the worker processes
+
+
+def _init(context):
+    _context.update(context)
+
+
+def _build_shard(shard):
+    start, stop = shard
+    return _build_rows(_context, start, stop)
+
+
+def _build_rows(context, start, stop):
+    """
+    :param context: see build_table
+    :param start: first row of the shard
+    :param stop: row after the last one
+    :return: (entries, conflicts). entries is an int array with the position in CompiledTable.actions and the rule
+    of each entry, one after the other. conflicts is a list of (row, rule, other rule, common lookahead bitmask).
+    """
+    width = context['width']
+    eps = context['eps']
+    columns = context['columns']
+    first = context['first']
+    follow = context['follow']
+    bodies = context['bodies']
+    productions = context['productions']
+
+    entries = array.array('i')
+    conflicts = []
+    for row in range(start, stop):
+        base = row * width
+        masks = []
+        seen = 0
+        for r in productions[row]:
+            lookahead = 0
+            for s in bodies[r]:
+                f = first[s]
+                lookahead |= f & ~eps
+                if not f & eps:
+                    break
+            else:
+                lookahead |= follow[row]  # The body derives ε
+
+            if seen & lookahead:
+                for other, m in zip(productions[row], masks):
+                    if m & lookahead:
+                        conflicts.append((row, other, r, m & lookahead))
+            new = lookahead & ~seen  # Entries already taken keep their first production
+            while new:
+                low = new & -new
+                entries.append(base + columns[low.bit_length() - 1])
+                entries.append(r)
+                new ^= low
+            masks.append(lookahead)
+            seen |= lookahead
+
+    return entries, conflicts
+
+
+def shards(costs, count):
+    """
+    Split rows in contiguous ranges of about the same cost
+    :param costs: cost of each row
+    :param count: number of ranges wanted
+    :return: list of (start, stop)
+    """
+    total = sum(costs)
+    result = []
+    start = 0
+    done = 0
+    for row, cost in enumerate(costs):
+        done += cost
+        if done * count >= total * (len(result) + 1) and row + 1 < len(costs):
+            result.append((start, row + 1))
+            start = row + 1
+    result.append((start, len(costs)))
+    return result
+
+
+def build_table(g, jobs=None, shards_per_job=4, collect_all=False):
+    """
+    Build the same CompiledTable as CompiledTable.from_grammar, with a pool of processes
+    :param g: grammar, with left recursion and left factors removed
+    :param jobs: number of processes, one per CPU by default. With 1 the rows are built in this process.
+    :param shards_per_job: shards per process, more shards balance the load better
+    :param collect_all: If False, only the first conflict is returned
+    :return: (CompiledTable, []) if g is LL(1), (None, list of Conflict) otherwise
+    """
+    index = g.terminal_index
+    first_sets = g.analysis('first')
+    follow_sets = g.analysis('follow')
+
+    nonterminals = list(g.nonterminals)
+    symbols = table_terminals(g) + nonterminals
+    ids = {s: i for i, s in enumerate(symbols)}
+    width = len(symbols) - len(nonterminals)
+
+    rules = []
+    productions = [[] for _ in nonterminals]
+    for r in g.iter_productions():
+        productions[ids[r.head] - width].append(len(rules))
+        rules.append(r)
+    bodies = [tuple(ids[s] for s in r.body if s != g.epsilon) for r in rules]
+
+    context = {
+        'width': width,
+        'eps': index.bit(g.epsilon),
+        'columns': [ids.get(t) for t in index.terminals],  # Column of each bit, ε has none
+        'first': [index.bit(t) for t in symbols[:width]] + [first_sets[x] for x in nonterminals],
+        'follow': [follow_sets[x] for x in nonterminals],
+        'bodies': bodies,
+        'productions': productions,
+    }
+    jobs = jobs or os.cpu_count() or 1
+    costs = [sum(len(bodies[r]) + 1 for r in p) for p in productions]
+    ranges = shards(costs, jobs * shards_per_job)
+    if jobs == 1:
+        results = [_build_rows(context, start, stop) for start, stop in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init, initargs=(context,)) as executor:
+            results = list(executor.map(_build_shard, ranges))
+
+    found = [c for _, conflicts in results for c in conflicts]
+    if found:
+        found = [Conflict(nonterminals[row], index.symbols(common), (rules[a], rules[b]))
+                 for row, a, b, common in found]
+        return None, found if collect_all else found[:1]
+
+    actions = array.array('i', [NO_RULE]) * (len(nonterminals) * width)
+    for entries, _ in results:
+        for i in range(0, len(entries), 2):
+            actions[entries[i]] = entries[i + 1]
+
+    rules = [(ids[r.head], body) for r, body in zip(rules, bodies)]
+    return CompiledTable(symbols, width, ids[g.start], rules, actions, [ids[x] for x in g.inline]), []
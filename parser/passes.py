@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import time
+
+from parser.diff import GrammarDiff
+from parser.functions import remove_left_recursion, remove_left_factoring, remove_useless_symbols
+
+
+class Pass:
+    """
+    A grammar transformation run by a PassManager
+    """
+
+    def __init__(self, name, transform, preserves=(), title=None):
+        """
+        :param name: short name used in timing reports
+        :param transform: function that takes a grammar and returns the transformed grammar
+        :param preserves: analyses still valid for the output when the input grammar is changed
+        :param title: description shown with intermediate results
+        """
+        self.name = name
+        self.transform = transform
+        self.preserves = set(preserves)
+        self.title = title or name
+
+    def __call__(self, grammar):
+        return self.transform(grammar)
+
+    def __repr__(self):
+        return 'Pass({})'.format(repr(self.name))
+
+
+# Removing useless symbols can drop terminals, so no analysis survives it. The other passes only add primed
+# nonterminals and ε-productions: their terminals, besides ε, are those of the input, so the terminal index
+# (which always has ε and the end of input) is still valid.
+REMOVE_USELESS = Pass('remove-useless', remove_useless_symbols, title='After removing useless symbols:')
+REMOVE_LEFT_RECURSION = Pass('remove-left-recursion', remove_left_recursion, preserves=['terminal-index'],
+                             title='After removing left-recursion:')
+REMOVE_LEFT_FACTORING = Pass('remove-left-factoring', remove_left_factoring, preserves=['terminal-index'],
+                             title='After removing left-factoring:')
+
+
+class PassManager:
+    """
+    Run a sequence of passes over a grammar.
+
+    Analyses (see grammar.ANALYSES) are computed lazily by the grammar the first time a pass asks for them.
+    Passes that return their input grammar keep every analysis. Otherwise, the analyses listed in the
+    pass' preserves, and whose dependencies are also preserved, are reused for the output grammar.
+    """
+
+    def __init__(self, passes=(), record_changes=False):
+        """
+        :param record_changes: keep the GrammarDiff of each pass in changes, to show the intermediate grammars
+        without keeping them
+        """
+        self.passes = list(passes)
+        self.record_changes = record_changes
+        self.timings = []
+        self.changes = []
+
+    def add(self, p):
+        self.passes.append(p)
+        return self
+
+    def run(self, grammar, callback=None):
+        """
+        Run all passes in order
+        :param grammar: input grammar, it is not modified
+        :param callback: called as callback(pass, grammar) after each pass
+        :return: the transformed grammar
+        """
+        self.timings = []
+        self.changes = []
+        for p in self.passes:
+            start = time.perf_counter()
+            result = p(grammar)
+            if result is not grammar:
+                result.keep_analyses(grammar, p.preserves)
+                result.keep_inline(grammar)
+            self.timings.append((p.name, time.perf_counter() - start))
+            if self.record_changes:
+                self.changes.append(GrammarDiff.between(grammar, result))
+
+            grammar = result
+            if callback:
+                callback(p, grammar)
+
+        return grammar
+
+    def report(self):
+        """
+        :return: one line per pass with the time it took in the last run
+        """
+        width = max([len(name) for name, _ in self.timings] + [0])
+        return '\n'.join('{:{width}} {:10.3f} ms'.format(name, t * 1000, width=width) for name, t in self.timings)
+
+
+def default_pipeline(remove_useless=False, record_changes=False):
+    """
+    Passes used by the CLI and the web interface
+    :param remove_useless: start by removing useless symbols
+    :param record_changes: see PassManager
+    :return: a PassManager
+    """
+    passes = [REMOVE_USELESS] if remove_useless else []
+    return PassManager(passes + [REMOVE_LEFT_RECURSION, REMOVE_LEFT_FACTORING], record_changes=record_changes)
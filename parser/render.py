@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import csv
+import html
+import json
+import sys
+
+
+def table_terminals(g):
+    """
+    Columns of the parsing table
+    :param g: input grammar
+    :return: sorted terminals without the empty symbol, EOF at the end
+    """
+    return sorted(set(g.terminals) - {g.epsilon, g.eof}) + [g.eof]
+
+
+def entry_rules(entry):
+    """
+    Normalize a parsing table entry
+    :param entry: a rule, a list of conflicting rules or None
+    :return: list of rules
+    """
+    if entry is None:
+        return []
+    if isinstance(entry, list):
+        return entry
+    return [entry]
+
+
+class TableRenderer:
+    """
+    Write a parsing table to a file object, one row at a time.
+    Subclasses implement begin, row and end. Each row is written with a single call to write.
+    """
+
+    def __init__(self, file=None):
+        self.file = file
+
+    def render(self, g, table):
+        """
+        Render a parsing table
+        :param g: the grammar the table was computed for
+        :param table: parsing table, as returned by Grammar.parsing_table
+        """
+        if self.file is None:
+            self.file = sys.stdout  # Resolved late, stdout may be redirected
+
+        terminals = table_terminals(g)
+        self.begin(g, terminals)
+        for x in g.nonterminals:
+            self.row(x, [entry_rules(table.get((x, t))) for t in terminals])
+        self.end()
+
+    def begin(self, g, terminals):
+        pass
+
+    def row(self, nonterminal, entries):
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+
+class TextRenderer(TableRenderer):
+    """
+    Fixed-width table. Column widths depend on every production, so they are computed before the first row.
+    """
+
+    def __init__(self, file=None, padding=4):
+        super().__init__(file)
+        self.padding = padding
+        self.table = None
+
+    def render(self, g, table):
+        self.table = table
+        super().render(g, table)
+
+    def begin(self, g, terminals):
+        self.width_nt = max([len(x) for x in g.nonterminals])  # non_terminals width
+        width = max([len(str(p)) for p in g.iter_productions()])
+
+        amb = [len(' | '.join(str(e) for e in x)) for x in self.table.values() if isinstance(x, list)]
+        if amb:
+            width = max(width, *amb)
+
+        width += self.padding
+        if width % 2 == 0:
+            width += 1  # Width must be odd to center correctly
+        self.width = width
+
+        header = '{:{width}}'.format('', width=self.width_nt + 2)
+        header += ''.join('{:^{width}}'.format(t, width=width) for t in terminals)
+        self.file.write(header + '\n')
+        self.file.write('-' * (len(terminals) * width + self.width_nt) + '\n\n')
+
+    def row(self, nonterminal, entries):
+        line = '{:{width}} |'.format(nonterminal, width=self.width_nt)
+        line += ''.join('{:^{width}}'.format(' | '.join(str(r) for r in e) or '-', width=self.width) for e in entries)
+        self.file.write(line + '\n')
+
+    def end(self):
+        self.file.write('\n')
+
+
+class CSVRenderer(TableRenderer):
+    def begin(self, g, terminals):
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow([''] + terminals)
+
+    def row(self, nonterminal, entries):
+        self.writer.writerow([nonterminal] + [' | '.join(str(r) for r in e) for e in entries])
+
+
+class MarkdownRenderer(TableRenderer):
+    @staticmethod
+    def escape(s):
+        return s.replace('|', '\\|')
+
+    def begin(self, g, terminals):
+        cells = [''] + [self.escape(t) for t in terminals]
+        self.file.write('| {} |\n|{}\n'.format(' | '.join(cells), '---|' * len(cells)))
+
+    def row(self, nonterminal, entries):
+        cells = [self.escape(nonterminal)] + [self.escape(' | '.join(str(r) for r in e)) for e in entries]
+        self.file.write('| {} |\n'.format(' | '.join(cells)))
+
+
+class HTMLRenderer(TableRenderer):
+    def begin(self, g, terminals):
+        cells = ''.join('<th>{}</th>'.format(html.escape(t, quote=False)) for t in terminals)
+        self.file.write('<table>\n<thead>\n<tr><th></th>{}</tr>\n</thead>\n<tbody>\n'.format(cells))
+
+    def row(self, nonterminal, entries):
+        cells = ''.join('<td>{}</td>'.format('<br>'.join(html.escape(str(r), quote=False) for r in e)) for e in entries)
+        self.file.write('<tr><th>{}</th>{}</tr>\n'.format(html.escape(nonterminal, quote=False), cells))
+
+    def end(self):
+        self.file.write('</tbody>\n</table>\n')
+
+
+class JSONLinesRenderer(TableRenderer):
+    """
+    One JSON object per line. The first line lists the terminals,
+    each following line holds the non-empty entries of a row.
+    """
+
+    def begin(self, g, terminals):
+        self.terminals = terminals
+        self.file.write(json.dumps({'terminals': terminals}, ensure_ascii=False) + '\n')
+
+    def row(self, nonterminal, entries):
+        cells = {t: [str(r) for r in e] for t, e in zip(self.terminals, entries) if e}
+        self.file.write(json.dumps({'nonterminal': nonterminal, 'entries': cells}, ensure_ascii=False) + '\n')
+
+
+RENDERERS = {
+    'text': TextRenderer,
+    'csv': CSVRenderer,
+    'markdown': MarkdownRenderer,
+    'html': HTMLRenderer,
+    'jsonl': JSONLinesRenderer,
+}
+
+
+def render_table(g, table, fmt='text', file=None):
+    """
+    Write a parsing table in the given format
+    :param fmt: one of RENDERERS keys
+    :param file: output file object, defaults to stdout
+    """
+    RENDERERS[fmt](file).render(g, table)
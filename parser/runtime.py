@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Predictive parsing with a compiled parsing table.
+
+A CompiledTable numbers the symbols of a grammar, terminals first, and keeps the parsing table as a flat array
+of production numbers, one row per nonterminal and one column per terminal, or per group of terminals with the same
+column once the table is minimized (see parser.minimize). It can be written to a single buffer
+and read back without copying the array, so several processes can share the same table (see parser.batch).
+"""
+import array
+import itertools
+import json
+import struct
+
+from parser.grammar import InvalidGrammar
+from parser.render import table_terminals
+
+MAGIC = b'LL1T'
+HEADER = struct.Struct('=4sII')  # magic, length of the JSON metadata, number of actions
+NO_RULE = -1
+
+
+class ParseError(Exception):
+    def __init__(self, message, position):
+        super().__init__(message)
+        self.position = position
+
+
+class Node:
+    """
+    Parse tree node. Leaves are terminals and have no children.
+    """
+    __slots__ = ('symbol', 'children')
+
+    def __init__(self, symbol, children=None):
+        self.symbol = symbol
+        self.children = children
+
+    def is_leaf(self):
+        return self.children is None
+
+    def __reduce__(self):
+        # Pickled as a flat preorder list of symbols and child counts, which is faster than pickling each
+        # node and isn't limited by the recursion limit
+        symbols = []
+        counts = []
+        stack = [self]
+        while stack:
+            n = stack.pop()
+            symbols.append(n.symbol)
+            if n.children is None:
+                counts.append(-1)
+            else:
+                counts.append(len(n.children))
+                stack.extend(reversed(n.children))
+
+        return _unflatten, (symbols, counts)
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and str(self) == str(other)
+
+    def __str__(self):
+        """
+        :return: the tree as an S-expression, e.g. (E (T id) (E' ε))
+        """
+        parts = []
+        stack = [self]
+        while stack:
+            n = stack.pop()
+            if isinstance(n, str):
+                parts.append(n)
+            elif n.is_leaf():
+                parts.append(n.symbol)
+            else:
+                parts.append('(' + n.symbol)
+                stack.append(')')
+                for c in reversed(n.children):
+                    stack.append(c)
+                    stack.append(' ')
+
+        return ''.join(parts)
+
+    def __repr__(self):
+        return 'Node({})'.format(str(self))
+
+
+def _unflatten(symbols, counts):
+    # In reverse preorder, the children of a node come right before it, last child first
+    stack = []
+    for symbol, count in zip(reversed(symbols), reversed(counts)):
+        if count < 0:
+            stack.append(Node(symbol))
+        elif count == 0:
+            stack.append(Node(symbol, []))
+        else:
+            children = stack[:-count - 1:-1]
+            del stack[-count:]
+            stack.append(Node(symbol, children))
+
+    return stack[0]
+
+
+class CompiledTable:
+    def __init__(self, symbols, width, start, rules, actions, inline=(), columns=None):
+        """
+        :param symbols: terminals, EOF last, followed by nonterminals
+        :param width: number of terminals, including EOF
+        :param start: number of the start symbol
+        :param rules: (head, body) of each production, as symbol numbers, without ε
+        :param actions: production number of each (nonterminal, column) pair, row by row. NO_RULE for errors.
+        :param inline: numbers of the nonterminals of EBNF operators, parse adds their children to their parent
+        :param columns: column of each terminal, one column per terminal if not given
+        """
+        self.symbols = symbols
+        self.width = width
+        self.start = start
+        self.eof = width - 1
+        self.rules = rules
+        self.actions = actions
+        self.ids = {s: i for i, s in enumerate(symbols[:self.eof])}  # EOF can't be an input token
+        self.bodies = [tuple(reversed(body)) for head, body in rules]  # Ready to push on the stack
+        self.inline = frozenset(inline)
+        self.columns = list(range(width)) if columns is None else list(columns)
+        self.stride = max(self.columns) + 1  # Length of a row
+
+    @staticmethod
+    def from_grammar(g, table=None):
+        """
+        :param g: LL(1) grammar
+        :param table: parsing table of g, computed if not given
+        :return: CompiledTable
+        """
+        if table is None:
+            table, ambiguous = g.parsing_table()
+
+        symbols = table_terminals(g) + list(g.nonterminals)
+        ids = {s: i for i, s in enumerate(symbols)}
+        width = len(symbols) - len(g.nonterminals)
+
+        rules = []
+        numbers = {}
+        for r in g.iter_productions():
+            numbers[r] = len(rules)
+            rules.append((ids[r.head], tuple(ids[s] for s in r.body if s != g.epsilon)))
+
+        actions = array.array('i', [NO_RULE]) * (len(g.nonterminals) * width)
+        for (x, t), entry in table.items():
+            if isinstance(entry, list):
+                raise InvalidGrammar("Grammar is not LL(1): {} has {} productions on {}".format(x, len(entry), t),
+                                     str(g))
+            actions[(ids[x] - width) * width + ids[t]] = numbers[entry]
+
+        return CompiledTable(symbols, width, ids[g.start], rules, actions, [ids[x] for x in g.inline])
+
+    def to_bytes(self):
+        """
+        :return: header, JSON metadata and the action array, aligned to its item size
+        """
+        meta = json.dumps({'symbols': self.symbols, 'width': self.width, 'start': self.start,
+                           'rules': self.rules, 'inline': sorted(self.inline), 'columns': self.columns},
+                          ensure_ascii=False).encode('utf-8')
+        actions = array.array('i', self.actions)
+        padding = -(HEADER.size + len(meta)) % actions.itemsize
+        return HEADER.pack(MAGIC, len(meta), len(actions)) + meta + b'\0' * padding + actions.tobytes()
+
+    @staticmethod
+    def from_buffer(buffer):
+        """
+        Read a table written by to_bytes. The action array is a view of buffer, it isn't copied.
+        :param buffer: bytes-like object, e.g. the buf of a SharedMemory
+        :return: CompiledTable
+        """
+        view = memoryview(buffer)
+        magic, length, count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Not a compiled parsing table")
+
+        offset = HEADER.size + length
+        meta = json.loads(bytes(view[HEADER.size:offset]).decode('utf-8'))
+        offset += -offset % array.array('i').itemsize
+        actions = view[offset:].cast('i')[:count]
+        rules = [(head, tuple(body)) for head, body in meta['rules']]
+
+        return CompiledTable(meta['symbols'], meta['width'], meta['start'], rules, actions, meta.get('inline', ()),
+                             meta.get('columns'))
+
+    @staticmethod
+    def from_module(module):
+        """
+        Load a table from a module written by parser.emit
+        :param module: the imported module
+        :return: CompiledTable
+        """
+        actions = array.array('i', itertools.chain.from_iterable(module.ACTIONS))
+        inline = [module.WIDTH + i for i, x in enumerate(getattr(module, 'INLINE', ())) if x]
+        return CompiledTable(list(module.SYMBOLS), module.WIDTH, module.START, list(module.RULES), actions, inline,
+                             getattr(module, 'COLUMNS', None))
+
+    def release(self):
+        """
+        Release the view of the buffer the table was read from, if any, so the buffer can be closed
+        """
+        if isinstance(self.actions, memoryview):
+            self.actions.release()
+
+    def expected(self, nonterminal):
+        """
+        :param nonterminal: symbol number
+        :return: terminals with an entry in the row of nonterminal
+        """
+        row = (nonterminal - self.width) * self.stride
+        return [self.symbols[t] for t in range(self.width) if self.actions[row + self.columns[t]] != NO_RULE]
+
+    def recognize(self, tokens):
+        """
+        Check if a sentence belongs to the language, without building the tree
+        :param tokens: sequence of terminals
+        :return: True if tokens is a sentence of the grammar, False otherwise
+        """
+        ids = self.ids
+        try:
+            stream = [ids[t] for t in tokens]
+        except KeyError:
+            return False
+        stream.append(self.eof)
+
+        width = self.width
+        stride = self.stride
+        columns = self.columns
+        actions = self.actions
+        bodies = self.bodies
+        stack = [self.start]
+        pos = 0
+        lookahead = stream[0]
+        column = columns[lookahead]
+        while stack:
+            s = stack.pop()
+            if s < width:
+                if s != lookahead:
+                    return False
+                pos += 1
+                lookahead = stream[pos]
+                column = columns[lookahead]
+            else:
+                r = actions[(s - width) * stride + column]
+                if r == NO_RULE:
+                    return False
+                stack.extend(bodies[r])
+
+        return lookahead == self.eof
+
+    def parse(self, tokens):
+        """
+        Build the parse tree of a sentence. Nodes are created when their symbol is popped, so the nonterminals of
+        EBNF operators add their symbols to the node they appear in, and a repetition gives a flat list of children
+        instead of one nested helper node per element.
+        :param tokens: sequence of terminals
+        :return: root Node
+        :raise ParseError: if tokens is not a sentence of the grammar
+        """
+        tokens = list(tokens)
+        stream = []
+        for pos, t in enumerate(tokens):
+            if t not in self.ids:
+                raise ParseError("Unknown token {} at position {}".format(t, pos), pos)
+            stream.append(self.ids[t])
+        stream.append(self.eof)
+
+        symbols = self.symbols
+        width = self.width
+        stride = self.stride
+        columns = self.columns
+        actions = self.actions
+        bodies = self.bodies
+        inline = self.inline
+        top = []
+        stack = [(self.start, top)]  # (symbol, children of the node it goes in)
+        pos = 0
+        while stack:
+            s, siblings = stack.pop()
+            lookahead = stream[pos]
+            if s < width:
+                if s != lookahead:
+                    raise ParseError("Expected {} at position {}, found {}".format(
+                        symbols[s], pos, symbols[lookahead]), pos)
+                siblings.append(Node(symbols[s]))
+                pos += 1
+                continue
+
+            r = actions[(s - width) * stride + columns[lookahead]]
+            if r == NO_RULE:
+                raise ParseError("Unexpected {} at position {}, expected one of: {}".format(
+                    symbols[lookahead], pos, ', '.join(self.expected(s))), pos)
+            if s not in inline:
+                node = Node(symbols[s], [])
+                siblings.append(node)
+                siblings = node.children
+            for c in bodies[r]:
+                stack.append((c, siblings))
+
+        if stream[pos] != self.eof:
+            raise ParseError("Expected end of input at position {}, found {}".format(pos, symbols[stream[pos]]), pos)
+
+        return top[0]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Recognize many short sentences at once with NumPy.
+
+The sentences are padded with EOF into a matrix, one row (lane) per sentence, and every lane has its own stack in
+a second matrix. Each step pops the top of every lane's stack together: lanes with a terminal on top compare it
+with their lookahead, lanes with a nonterminal look up their production in the table and push its body. A lane
+leaves the batch when it accepts or fails, so the steps of a batch are those of its longest sentence; sentences
+are sorted by length so lanes of similar length share a batch.
+
+NumPy is optional, VectorRecognizer raises ImportError without it.
+"""
+import itertools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from parser.runtime import NO_RULE
+
+
+class _Ids(dict):
+    def __missing__(self, token):
+        return -1  # Unknown token
+
+
+class VectorRecognizer:
+    def __init__(self, table, lanes=65536):
+        """
+        :param table: CompiledTable
+        :param lanes: number of sentences advanced together
+        """
+        if np is None:
+            raise ImportError("VectorRecognizer needs NumPy")
+        self.table = table
+        self.lanes = lanes
+        self.ids = _Ids(table.ids)
+        width = table.width
+        rules = len(table.rules)
+
+        # One dense row per symbol, indexed by the lookahead terminal. Rows of terminals match only themselves.
+        # A match is an extra production with an empty body that reads a token
+        self.steps = np.full((len(table.symbols), width), NO_RULE, dtype=np.int32)
+        self.steps[np.arange(width), np.arange(width)] = rules
+        actions = np.array(table.actions, dtype=np.int32).reshape(-1, table.stride)
+        self.steps[width:] = actions[:, np.array(table.columns)]
+        self.steps = self.steps.ravel()
+
+        # A production chosen for a lookahead terminal that starts with a terminal starts with that one,
+        # so it is matched in the same step
+        bodies = [b[:-1] if b and b[-1] < width else b for b in table.bodies] + [()]
+        self.lengths = np.array([len(b) for b in bodies], dtype=np.int64)
+        self.reads = np.array([len(b) != len(a) for a, b in zip(table.bodies, bodies)] + [1], dtype=np.int64)
+        self.bodies = np.zeros((rules + 1, int(self.lengths.max()) or 1), dtype=np.int32)
+        for r, body in enumerate(bodies):
+            self.bodies[r, :len(body)] = body  # Reversed, the first symbol ends up on top
+
+    def encode(self, documents):
+        """
+        :param documents: sequence of documents, each a string of space-separated tokens or a sequence of tokens
+        :return: (matrix of token numbers padded with EOF, with one more column than the longest document,
+        length of each document, position of the first unknown token of each document or -1)
+        """
+        documents = [d.split() if isinstance(d, str) else d for d in documents]
+        lengths = np.fromiter(map(len, documents), dtype=np.int64, count=len(documents))
+        total = int(lengths.sum())
+        tokens = np.fromiter(map(self.ids.__getitem__, itertools.chain.from_iterable(documents)), dtype=np.int32,
+                             count=total)
+
+        stream = np.full((len(documents), int(lengths.max(initial=0)) + 1), self.table.eof, dtype=np.int32)
+        rows = np.repeat(np.arange(len(documents)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        stream[rows, np.arange(total) - np.repeat(starts, lengths)] = tokens
+
+        unknown = stream < 0
+        first = np.where(unknown.any(axis=1), unknown.argmax(axis=1), -1)
+        stream[unknown] = self.table.eof
+        return stream, lengths, first
+
+    def recognize(self, documents):
+        """
+        :param documents: sequence of documents, see encode
+        :return: (bool array, True for the sentences of the grammar,
+        int array with the token position where each document fails, -1 for sentences of the grammar).
+        Positions are those of the ParseError raised by CompiledTable.parse.
+        """
+        stream, lengths, errors = self.encode(documents)
+        order = np.argsort(lengths, kind='stable')
+        for i in range(0, len(order), self.lanes):
+            lanes = order[i:i + self.lanes]
+            lanes = lanes[errors[lanes] < 0]  # Unknown tokens are reported before parsing
+            if lanes.size:
+                errors[lanes] = self.__run(stream[lanes, :int(lengths[lanes].max()) + 1])
+
+        return errors < 0, errors
+
+    def __run(self, stream):
+        """
+        :param stream: token numbers of a batch, each row ending in EOF
+        :return: error position of each row, -1 for accepted rows
+        """
+        width = self.table.width
+        eof = self.table.eof
+        count, size = stream.shape
+        stream = stream.ravel()
+        push = np.arange(self.bodies.shape[1])
+
+        depth = 4 * size + push.size  # Stacks grow when they need more
+        stack = np.empty(count * depth, dtype=np.int32)
+        stack[::depth] = self.table.start
+        sp = np.ones(count, dtype=np.int64)  # Size of each stack
+        pos = np.zeros(count, dtype=np.int64)
+        errors = np.full(count, -1, dtype=np.int64)
+        active = np.arange(count)
+        while active.size:
+            top = sp[active] - 1
+            p = pos[active]
+            rules = self.steps[stack[active * depth + top] * width + stream[active * size + p]]
+
+            failed = rules == NO_RULE
+            if failed.any():
+                errors[active[failed]] = p[failed]
+                keep = ~failed
+                active, top, p, rules = active[keep], top[keep], p[keep], rules[keep]
+
+            # Replace the top of the stack by the body of the production, the whole padded body is written
+            # but only its length counts
+            if int(top.max(initial=0)) + push.size > depth:
+                stack = np.concatenate([stack.reshape(count, depth), np.empty((count, depth), np.int32)], axis=1)
+                stack = stack.ravel()
+                depth *= 2
+            stack[(active * depth + top)[:, None] + push] = self.bodies[rules]
+            sp[active] = top + self.lengths[rules]
+            pos[active] = p + self.reads[rules]
+
+            # Lanes with an empty stack accept if all their tokens were read
+            done = sp[active] == 0
+            if done.any():
+                finished = active[done]
+                rejected = finished[stream[finished * size + pos[finished]] != eof]
+                errors[rejected] = pos[rejected]
+                active = active[~done]
+
+        return errors
@@ -1,10 +1,37 @@
 # -*- coding: utf-8 -*-
+from parser import daemon, vectorized
+from parser.batch import parse_batch
+from parser.diff import GrammarDiff, replay, rewind
+from parser.emit import module_source
 from parser import functions as f
+from parser.generate import DEFAULT_MAX_LENGTH, SentenceGenerator, min_lengths
 from parser.grammar import Grammar, InvalidGrammar
+from parser.incremental import Edit, IncrementalParser, apply_edits
+from parser.metrics import EXITED, Registry
+from parser.minimize import minimize
+from parser.modules import ModuleCache, parse_module, link_modules
+from parser.parallel import build_table, shards
+from parser.passes import Pass, PassManager, default_pipeline
+from parser.render import render_table
 from parser.rule import Rule, InvalidProduction
+from parser.runtime import CompiledTable, Node, ParseError
 from tests import test_data
 
+import fcntl
+import importlib.util
+import io
+import json
+import os
+import pickle
+import random
+import socket
+import tempfile
+import threading
+import types
 import unittest
+import unittest.mock
+
+import parse
 
 
 class TestGrammarEquality(unittest.TestCase):
@@ -37,6 +64,40 @@ class TestGrammarEquality(unittest.TestCase):
         self.assertNotEqual(self.a, self.c)
         self.assertNotEqual(self.b, self.c)
 
+    def test_fingerprint(self):
+        self.assertEqual(self.a.fingerprint, self.b.fingerprint)
+        self.assertEqual(hash(self.a), hash(self.b))
+        self.assertNotEqual(self.a.fingerprint, self.c.fingerprint)
+
+        d = {self.a: 'a'}
+        self.assertEqual('a', d[self.b])
+
+    def test_fingerprint_update(self):
+        before = self.a.fingerprint
+        rule = Rule('Z', ('.',))
+        self.a.add_rule(rule)
+        self.assertNotEqual(before, self.a.fingerprint)
+        self.a.remove_rule(rule)
+        self.assertEqual(before, self.a.fingerprint)
+
+        self.a.eof = '#'
+        self.assertNotEqual(self.a, self.b)
+
+    def test_symbols_not_joined(self):
+        a = Grammar(start='Y')
+        a.add_rule(Rule('Y', ('world', 'Z')))
+        b = Grammar(start='Y')
+        b.add_rule(Rule('Y', ('world Z',)))
+        self.assertNotEqual(a, b)
+
+    def test_transformations_keep_input(self):
+        for case in test_data.examples:
+            g = f.parse_bnf(case)
+            fingerprint = g.fingerprint
+            f.remove_left_factoring(f.remove_left_recursion(g))
+            self.assertEqual(fingerprint, g.fingerprint)
+            self.assertEqual(g, f.parse_bnf(case))
+
 
 class TestParseBNF(unittest.TestCase):
     """Basic test cases to parse BNF."""
@@ -69,6 +130,24 @@ class TestParseBNF(unittest.TestCase):
             text = str(g)
             self.assertEqual(g, f.parse_bnf(text))
 
+    def test_ebnf(self):
+        g = f.parse_bnf("%ebnf\n"
+                        "L -> '(' id ( ',' id )* ')' | x? ( a | b )+\n"
+                        "M -> ( ',' id )*")
+        self.assertEqual(f.parse_bnf("L -> ( id L_1 ) | L_2 L_3 L_4\n"
+                                     "M -> L_1\n"
+                                     "L_1 -> , id L_1 | ε\n"
+                                     "L_2 -> x | ε\n"
+                                     "L_3 -> a | b\n"
+                                     "L_4 -> L_3 L_4 | ε"), g)
+        self.assertEqual({'L_1', 'L_2', 'L_3', 'L_4'}, g.inline)
+        self.assertEqual(g, f.parse_bnf("L -> '(' id (',' id)* ')' | x? (a | b)+\nM -> (',' id)*", ebnf=True))
+
+    def test_invalid_ebnf(self):
+        for text in ["S -> ( a", "S -> a )", "S -> * a", "S -> 'a"]:
+            with self.assertRaises(InvalidGrammar):
+                f.parse_bnf(text, ebnf=True)
+
 
 class TestRemoveLeftRecursion(unittest.TestCase):
     def test_immediate_recursion(self):
@@ -94,6 +173,17 @@ class TestRemoveLeftRecursion(unittest.TestCase):
             for p in g.iter_productions():
                 self.assertFalse(p.is_left_recursive(), msg='{} is left-recursive'.format(p))
 
+    def test_has_left_recursion(self):
+        self.assertTrue(f.has_left_recursion(f.parse_bnf(test_data.unsolved_left_recursion)))
+        self.assertTrue(f.has_left_recursion(f.parse_bnf(test_data.unsolved_indirect_recursion_book_example)))
+        self.assertTrue(f.has_left_recursion(f.parse_bnf("S -> A S a | b\n"
+                                                         "A -> c | ε")))  # Hidden behind nullable A
+        self.assertFalse(f.has_left_recursion(f.parse_bnf(test_data.solved_left_recursion)))
+
+    def test_no_recursion_keeps_grammar(self):
+        g = f.parse_bnf(test_data.solved_left_recursion)
+        self.assertIs(g, f.remove_left_recursion(g))
+
 
 class TestRemoveLeftFactoring(unittest.TestCase):
     def test_check_left_factor(self):
@@ -119,6 +209,117 @@ class TestRemoveLeftFactoring(unittest.TestCase):
             self.assertFalse(f.check_left_factors(g), msg='{} has left factors'.format(g))
 
 
+class TestPassManager(unittest.TestCase):
+    def test_default_pipeline(self):
+        for case in test_data.examples:
+            g = f.parse_bnf(case)
+            expected = f.remove_left_factoring(f.remove_left_recursion(g))
+            pipeline = default_pipeline()
+            self.assertEqual(expected, pipeline.run(g))
+            self.assertEqual(['remove-left-recursion', 'remove-left-factoring'],
+                             [name for name, t in pipeline.timings])
+
+    def test_analyses_reused(self):
+        g = f.parse_bnf(test_data.book_example)
+        first = g.analysis('first')
+        h = default_pipeline(remove_useless=True).run(g)
+        self.assertIs(g, h)
+        self.assertIs(first, h.analysis('first'))
+
+    def test_builtin_preserves(self):
+        g = f.parse_bnf(test_data.unsolved_left_recursion)
+        index = g.analysis('terminal-index')
+        h = default_pipeline().run(g)
+        self.assertIsNot(g, h)
+        self.assertIs(index, h.analyses['terminal-index'])
+        self.assertEqual(set(h.analyses), {'terminal-index'})
+        self.assertTrue(h.is_ll1())
+
+    def test_preserved_dependencies(self):
+        g = f.parse_bnf(test_data.book_example)
+        g.follow('E')
+        rename = Pass('copy', lambda x: f.remove_left_recursion(f.parse_bnf(str(x))), preserves=['follow'])
+        h = PassManager([rename]).run(g)
+        self.assertNotIn('follow', h.analyses)  # FIRST wasn't preserved, so FOLLOW can't be either
+
+        keep = Pass('copy', lambda x: f.parse_bnf(str(x)), preserves=['terminal-index', 'first', 'follow'])
+        h = PassManager([keep]).run(g)
+        self.assertIs(g.analysis('follow'), h.analyses['follow'])
+
+
+class TestDiff(unittest.TestCase):
+    def test_replay_and_rewind(self):
+        for case in test_data.examples:
+            g = f.parse_bnf(case)
+            stages = []
+            pipeline = default_pipeline(record_changes=True)
+            h = pipeline.run(g, callback=lambda p, grammar: stages.append(grammar))
+            self.assertEqual(len(stages), len(pipeline.changes))
+            for expected, replayed in zip(stages, replay(g, pipeline.changes)):
+                self.assertEqual(expected, replayed)
+                self.assertEqual(str(expected), str(replayed))
+            original = rewind(h, pipeline.changes)
+            self.assertEqual(str(g), str(original))
+            self.assertEqual(g.start, original.start)
+
+    def test_renamed(self):
+        g = f.parse_bnf("S -> A b\nA -> a A | c")
+        h = f.parse_bnf("S -> B b | d\nB -> a B | c")
+        diff = GrammarDiff.between(g, h)
+        self.assertEqual({'A': 'B'}, dict(diff.renamed))
+        self.assertEqual([], diff.removed)
+        self.assertEqual([Rule('S', ('d',))], diff.added)
+        self.assertEqual("A renamed to B\n+ {}".format(Rule('S', ('d',))), str(diff))
+        self.assertEqual(str(h), str(diff.apply(g)))
+        self.assertEqual(str(g), str(diff.invert().apply(h)))
+
+    def test_unchanged(self):
+        g = f.parse_bnf(test_data.book_example)
+        self.assertFalse(GrammarDiff.between(g, g))
+        self.assertFalse(GrammarDiff.between(g, f.parse_bnf(test_data.book_example)))
+
+    def test_build_keeps_final_grammar(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        grammars = list(parse.stage_grammars(result))
+        self.assertEqual(['Original:', 'After removing left-recursion:', 'After removing left-factoring:'],
+                         [title for title, _ in grammars])
+        self.assertEqual(str(f.parse_bnf(test_data.unsolved_left_recursion)), str(grammars[0][1]))
+        self.assertEqual(result.grammar, grammars[-1][1])
+
+
+class TestRemoveUselessSymbols(unittest.TestCase):
+    def test_useless(self):
+        g = f.parse_bnf("S -> a B | b | U\n"
+                        "B -> b\n"
+                        "U -> U x\n"
+                        "Z -> z")
+        h = f.remove_useless_symbols(g)
+        self.assertEqual(f.parse_bnf("S -> a B | b\n"
+                                     "B -> b"), h)
+
+    def test_unreachable_after_unproductive(self):
+        # C is only reachable through a production that uses unproductive U
+        g = f.parse_bnf("S -> a | U C\n"
+                        "U -> U b\n"
+                        "C -> c")
+        h = f.remove_useless_symbols(g)
+        self.assertEqual(['S'], list(h.nonterminals))
+
+    def test_unproductive_start(self):
+        with self.assertRaises(InvalidGrammar):
+            f.remove_useless_symbols(f.parse_bnf("S -> a S"))
+
+    def test_cases(self):
+        for case in test_data.examples:
+            g = f.parse_bnf(case)
+            try:
+                h = f.remove_useless_symbols(g)
+            except InvalidGrammar:
+                continue  # e.g. X -> a A, A -> x X never derives a finite string
+            self.assertLessEqual(set(h.nonterminals), set(g.nonterminals))
+            self.assertEqual(h, f.remove_useless_symbols(h))
+
+
 class TestFirst(unittest.TestCase):
     def test_book_example(self):
         g = f.parse_bnf(test_data.book_example)
@@ -133,6 +334,19 @@ class TestFirst(unittest.TestCase):
         for x, first in answers.items():
             self.assertEqual(first, set(g.first(x)))
 
+    def test_nullable_prefix(self):
+        g = f.parse_bnf("S -> A a | b\n"
+                        "A -> c | ε")
+        self.assertEqual(['a', 'b', 'c'], g.first('S'))
+        self.assertEqual(['a', 'c'], g.first(('A', 'a')))
+        self.assertEqual(['c', 'ε'], g.first(('A', 'A')))
+
+    def test_mask(self):
+        g = f.parse_bnf(test_data.book_example)
+        index = g.terminal_index
+        self.assertEqual(index.mask(['(', 'id']), g.first_mask('E'))
+        self.assertEqual(g.first('T'), index.symbols(g.first_mask('T')))
+
     def test_cases(self):
         try:
             for case in test_data.examples:
@@ -194,6 +408,14 @@ class TestParsingTable(unittest.TestCase):
 
             self.assertTrue(amb)
 
+    def test_conflict_entry(self):
+        g = f.parse_bnf("S -> a | a b | c")
+        table, amb = g.parsing_table()
+
+        self.assertTrue(amb)
+        self.assertEqual([Rule('S', ('a',)), Rule('S', ('a', 'b'))], table[('S', 'a')])
+        self.assertEqual(Rule('S', ('c',)), table[('S', 'c')])
+
     def test_cases(self):
         try:
             for case in test_data.examples:
@@ -203,6 +425,637 @@ class TestParsingTable(unittest.TestCase):
             self.fail(str(e))
 
 
+class TestCheckLL1(unittest.TestCase):
+    def test_ll1(self):
+        g = f.parse_bnf(test_data.book_example)
+        self.assertTrue(g.is_ll1())
+        self.assertEqual([], g.check_ll1(collect_all=True))
+
+    def test_ambiguous(self):
+        for case in test_data.ambiguous:
+            g = f.parse_bnf(case)
+            self.assertFalse(g.is_ll1())
+
+    def test_first_conflict(self):
+        g = f.parse_bnf("S -> a | a b | a c\n"
+                        "A -> x | x y")
+        conflicts = g.check_ll1()
+        self.assertEqual(1, len(conflicts))
+        self.assertEqual('S', conflicts[0].nonterminal)
+        self.assertEqual(['a'], conflicts[0].terminals)
+
+        conflicts = g.check_ll1(collect_all=True)
+        self.assertEqual(4, len(conflicts))
+
+    def test_cases(self):
+        for case in test_data.examples:
+            g = f.parse_bnf(case)
+            table, amb = g.parsing_table()
+            self.assertEqual(amb, not g.is_ll1())
+
+    def test_check_job_errors(self):
+        name, conflicts, error = parse._check_job(('g#1', 'A', 'ε', '$', False))
+        self.assertTrue(error.startswith('invalid grammar: '))
+        with unittest.mock.patch('parse.check_grammar', side_effect=RuntimeError('boom')):
+            self.assertEqual(('g#2', [], 'error: RuntimeError: boom'),
+                             parse._check_job(('g#2', 'A -> a', 'ε', '$', False)))
+
+
+class TestRender(unittest.TestCase):
+    def setUp(self):
+        self.g = f.remove_left_factoring(f.parse_bnf("S -> a | a b\n"
+                                                     "B -> x | ε"))
+        self.table, amb = self.g.parsing_table()
+
+    def render(self, fmt):
+        out = io.StringIO()
+        render_table(self.g, self.table, fmt, file=out)
+        return out.getvalue().splitlines()
+
+    def test_csv(self):
+        lines = self.render('csv')
+        self.assertEqual(',a,b,x,$', lines[0])
+        self.assertEqual('B,,,B → x,', lines[-1])
+
+    def test_markdown(self):
+        lines = self.render('markdown')
+        self.assertEqual('|---|---|---|---|---|', lines[1])
+        self.assertEqual(len(self.g.nonterminals) + 2, len(lines))
+
+    def test_html(self):
+        lines = self.render('html')
+        self.assertIn("<tr><th>S'</th><td></td><td>S' → b</td><td></td><td>S' → ε</td></tr>", lines)
+
+    def test_jsonl(self):
+        rows = [json.loads(l) for l in self.render('jsonl')]
+        self.assertEqual(['a', 'b', 'x', '$'], rows[0]['terminals'])
+        self.assertEqual({'x': ['B → x']}, rows[-1]['entries'])
+
+    def test_text(self):
+        out = io.StringIO()
+        f.pprint_table(self.g, self.table, file=out)
+        self.assertIn("S' → ε", out.getvalue())
+
+
+class TestModules(unittest.TestCase):
+    expr = ("Expr -> Term Expr'\n"
+            "Expr' -> + Term Expr' | ε\n"
+            "Term -> id | num | ( Expr )")
+    stmt = ("%include expr.bnf\n"
+            "Stmt -> id = Expr ; | print Expr ;")
+    main = ("%include stmt.bnf\n"
+            "Program -> Stmt Program | ε")
+
+    def modules(self, expr):
+        return [parse_module('expr.bnf', expr), parse_module('stmt.bnf', self.stmt), parse_module('main.bnf', self.main)]
+
+    def test_link(self):
+        g, table, amb = link_modules(self.modules(self.expr))
+        text = '\n'.join(l for l in (self.main + '\n' + self.stmt + '\n' + self.expr).split('\n') if '%' not in l)
+        expected, expected_amb = f.parse_bnf(text).parsing_table()
+
+        self.assertEqual('Program', g.start)
+        self.assertEqual(['stmt.bnf'], parse_module('main.bnf', self.main).includes)
+        self.assertEqual(expected_amb, amb)
+        self.assertEqual(expected, table)
+
+    def test_cache(self):
+        cache = ModuleCache()
+        link_modules(self.modules(self.expr), cache=cache)
+        self.assertEqual(3, cache.misses)
+
+        # FIRST(Expr) doesn't change, so only expr.bnf is analysed again
+        g, table, amb = link_modules(self.modules(self.expr.replace("+ Term", "+ Term Expr' | - Term")), cache=cache)
+        self.assertEqual(4, cache.misses)
+        self.assertEqual(Rule("Expr'", ('ε',)), table[("Expr'", ';')])
+
+    def test_cache_save(self):
+        cache = ModuleCache()
+        link_modules(self.modules(self.expr), cache=cache)
+        link_modules(self.modules(self.expr.replace("+ Term", "+ Term Expr' | - Term")), cache=cache)
+        self.assertEqual(4, len(cache.summaries))
+
+        # The summary of the old expr.bnf isn't saved
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'modules.json')
+            cache.save(path)
+            loaded = ModuleCache.load(path)
+        self.assertEqual(cache.used, set(loaded.summaries))
+        self.assertEqual(3, len(loaded.summaries))
+
+    def test_cache_cyclic(self):
+        cache = ModuleCache()
+        modules = [parse_module('a.bnf', '%include b.bnf\nA -> B a | x'),
+                   parse_module('b.bnf', '%include a.bnf\nB -> A b | y')]
+        link_modules(modules, cache=cache)
+        self.assertLess(len(cache.used), len(cache.summaries))
+        self.assertEqual(2, len(cache.used))
+
+    def test_pipeline(self):
+        g, table, amb = link_modules([parse_module('list.bnf', 'L -> L , id | id'),
+                                      parse_module('main.bnf', '%include list.bnf\nS -> ( L )')])
+        self.assertFalse(amb)
+        expected = default_pipeline().run(f.parse_bnf('S -> ( L )\nL -> L , id | id'))
+        self.assertEqual(expected, g)
+        self.assertEqual(expected.parsing_table()[0], table)
+
+    def test_duplicate(self):
+        with self.assertRaises(InvalidGrammar):
+            link_modules([parse_module('a.bnf', 'A -> a'), parse_module('b.bnf', 'A -> b')])
+
+
+class TestDaemon(unittest.TestCase):
+    def test_handle_request(self):
+        status, output = parse.handle_request(['A -> hola | mundo', '-f', 'csv'], os.getcwd())
+        self.assertEqual(0, status)
+        self.assertEqual(',hola,mundo,$\nA,A → hola,A → mundo,\n', output)
+
+        status, output = parse.handle_request(['--bogus'], os.getcwd())
+        self.assertEqual(2, status)
+
+        for flag in ('--serve', '--client', '-w'):
+            status, output = parse.handle_request(['-i', 'grammar.txt', flag], os.getcwd())
+            self.assertEqual(2, status)
+            self.assertIn('not allowed', output)
+
+    def test_default_socket(self):
+        environ = dict(os.environ)
+        try:
+            os.environ['XDG_RUNTIME_DIR'] = '/run/user/1000'
+            self.assertEqual('/run/user/1000/ll1-parser.sock', daemon.default_socket())
+            del os.environ['XDG_RUNTIME_DIR']
+            os.environ['TMPDIR'] = tempfile.mkdtemp()
+            path = daemon.default_socket()
+            daemon._private_directory(path)
+            self.assertEqual(0o700, os.stat(os.path.dirname(path)).st_mode & 0o777)
+            os.chmod(os.path.dirname(path), 0o755)
+            with self.assertRaises(PermissionError):
+                daemon._private_directory(path)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+    def test_build_cached(self):
+        self.assertIsNot(parse.build('A -> hola | mundo'), parse.build('A -> hola | mundo'))
+        with parse.cached_builds():
+            self.assertIs(parse.build('A -> hola | mundo'), parse.build('A -> hola | mundo'))
+        self.assertIsNot(parse.build('A -> hola | mundo'), parse.build('A -> hola | mundo'))
+
+    def test_forward(self):
+        path = os.path.join(tempfile.mkdtemp(), 'test.sock')
+        self.assertIsNone(daemon.forward(path, ['A -> a']))
+
+        thread = threading.Thread(target=daemon.serve, args=(path, parse.handle_request), daemon=True)
+        thread.start()
+        while not os.path.exists(path):
+            thread.join(0.01)
+
+        status, output = daemon.forward(path, ['-c'] + test_data.ambiguous[-1].split('\n'))
+        self.assertEqual(1, status)
+        self.assertIn('not LL(1)', output)
+
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        self.assertIn(daemon.peer_uid(client), (None, os.getuid()))
+        client.close()
+
+        # A second server doesn't take the socket of the running one
+        with self.assertRaises(OSError):
+            daemon.serve(path, parse.handle_request)
+        self.assertEqual(0, daemon.forward(path, ['A -> a'])[0])
+
+
+class TestWatch(unittest.TestCase):
+    def test_rebuild(self):
+        path = os.path.join(tempfile.mkdtemp(), 'grammars.txt')
+        with open(path, 'w') as file:
+            file.write(test_data.book_example + '\n\n' + test_data.exam_exercise)
+
+        rendered = {}
+        pieces, changed = parse.rebuild([path], rendered)
+        self.assertEqual(2, len(changed))
+
+        with open(path, 'w') as file:
+            file.write(test_data.book_example + '\n\n' + test_data.exam_exercise.replace('real', 'float'))
+        new_pieces, changed = parse.rebuild([path], rendered)
+        self.assertEqual(1, len(changed))
+        self.assertEqual(pieces[0], new_pieces[0])
+        self.assertIn('float', new_pieces[1])
+        self.assertEqual(2, len(rendered))
+
+    def test_render_error(self):
+        with unittest.mock.patch('parse.do_the_whole_thing', side_effect=RecursionError('too deep')):
+            output = parse.render_grammar('A -> a')
+        self.assertEqual('Error: RecursionError: too deep\nA -> a\n\n', output)
+
+    def test_write_atomic(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'table.txt')
+        parse.write_atomic(path, 'old')
+        parse.write_atomic(path, 'new')
+        with open(path) as file:
+            self.assertEqual('new', file.read())
+        self.assertEqual(['table.txt'], os.listdir(directory))
+
+        os.chmod(path, 0o644)
+        parse.write_atomic(path, 'newer')
+        self.assertEqual(0o644, os.stat(path).st_mode & 0o777)
+
+
+class TestGenerate(unittest.TestCase):
+    def test_min_lengths(self):
+        g = f.parse_bnf(test_data.unsolved_left_recursion)
+        self.assertEqual({'E': 1, 'T': 1, 'F': 1}, min_lengths(g))
+        g = f.parse_bnf(test_data.exam_exercise)
+        self.assertEqual({'P': 0, 'D': 0, 'T': 1}, min_lengths(g))
+
+    def test_max_length(self):
+        g = f.parse_bnf(test_data.unsolved_left_recursion)
+        generator = SentenceGenerator(g, random.Random(0))
+        terminals = set(g.terminals)
+        for sentence in generator.sentences(200, max_length=15):
+            self.assertLessEqual(len(sentence), 15)
+            self.assertLessEqual(set(sentence), terminals)
+
+    def test_terminates(self):
+        g = f.parse_bnf(test_data.unsolved_left_recursion)
+        for sentence in SentenceGenerator(g, random.Random(0)).sentences(50):
+            self.assertLessEqual(len(sentence), DEFAULT_MAX_LENGTH)
+        # Nullable recursion doesn't use up the budget
+        g = f.parse_bnf("S -> N S S | b | ε\nN -> a | ε")
+        for sentence in SentenceGenerator(g, random.Random(0)).sentences(50, max_length=10):
+            self.assertLessEqual(len(sentence), 10)
+
+    def test_deep(self):
+        # Deeper than the recursion limit
+        g = f.parse_bnf('\n'.join('A{} -> a A{}'.format(i, i + 1) for i in range(5000)) + '\nA5000 -> b')
+        sentence = list(SentenceGenerator(g).tokens())
+        self.assertEqual(['a'] * 5000 + ['b'], sentence)
+
+    def test_seed(self):
+        g = f.parse_bnf(test_data.book_example)
+        a = list(SentenceGenerator(g, random.Random(42)).sentences(10, max_length=30))
+        b = list(SentenceGenerator(g, random.Random(42)).sentences(10, max_length=30))
+        self.assertEqual(a, b)
+
+    def test_unproductive(self):
+        with self.assertRaises(InvalidGrammar):
+            SentenceGenerator(f.parse_bnf("S -> a S"))
+
+
+class TestRuntime(unittest.TestCase):
+    def setUp(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        self.g = result.grammar
+        self.table = CompiledTable.from_grammar(self.g, result.table)
+
+    def test_recognize(self):
+        self.assertTrue(self.table.recognize('id + id * ( id )'.split()))
+        self.assertFalse(self.table.recognize('id +'.split()))
+        self.assertFalse(self.table.recognize('id id'.split()))
+        self.assertFalse(self.table.recognize('id - id'.split()))
+        self.assertFalse(self.table.recognize([]))
+
+    def test_parse(self):
+        tree = self.table.parse('id * id'.split())
+        self.assertEqual("(E (T (F id) (T' * (F id) (T'))) (E'))", str(tree))
+        with self.assertRaises(ParseError) as cm:
+            self.table.parse('id + )'.split())
+        self.assertEqual(2, cm.exception.position)
+
+    def test_generated(self):
+        generator = SentenceGenerator(self.g, random.Random(0))
+        for sentence in generator.sentences(50, max_length=20):
+            self.assertTrue(self.table.recognize(sentence))
+            leaves = []
+            stack = [self.table.parse(sentence)]
+            while stack:
+                n = stack.pop()
+                if n.is_leaf():
+                    leaves.append(n.symbol)
+                else:
+                    stack.extend(reversed(n.children))
+            self.assertEqual(sentence, leaves)
+
+    def test_from_buffer(self):
+        table = CompiledTable.from_buffer(self.table.to_bytes())
+        self.assertEqual(list(self.table.actions), list(table.actions))
+        self.assertEqual(str(self.table.parse(['id'])), str(table.parse(['id'])))
+        table.release()
+
+    def test_pickle_tree(self):
+        sentence = ['('] * 2000 + ['id'] + [')'] * 2000  # Deeper than the recursion limit
+        tree = self.table.parse(sentence)
+        self.assertEqual(tree, pickle.loads(pickle.dumps(tree)))
+        self.assertEqual(Node('id'), pickle.loads(pickle.dumps(Node('id'))))
+
+    def test_ambiguous(self):
+        g = f.parse_bnf(test_data.ambiguous[0])
+        with self.assertRaises(InvalidGrammar):
+            CompiledTable.from_grammar(g)
+
+    def test_ebnf(self):
+        result = parse.build("%ebnf\nS -> '(' ( id ( ',' id )* )? ')'")
+        table = CompiledTable.from_grammar(result.grammar, result.table)
+        tree = table.parse(['('] + ['id', ','] * 5000 + ['id', ')'])
+        self.assertEqual(['(', 'id', ','], [c.symbol for c in tree.children[:3]])
+        self.assertEqual(10003, len(tree.children))  # The repetition is flat
+        self.assertEqual("(S ( ))", str(table.parse('( )'.split())))
+        self.assertFalse(table.recognize('( id , )'.split()))
+
+        loaded = CompiledTable.from_buffer(table.to_bytes())
+        self.assertEqual(table.inline, loaded.inline)
+        self.assertEqual("(S ( id , id ))", str(loaded.parse('( id , id )'.split())))
+        loaded.release()
+
+
+class TestMinimize(unittest.TestCase):
+    def test_merge(self):
+        result = parse.build("S -> a A | b B | A e\nA -> c A | d\nB -> c B | d")
+        table = CompiledTable.from_grammar(result.grammar, result.table)
+        minimized, reduction = minimize(table)
+        self.assertEqual({'B': 'A'}, reduction.nonterminals)
+        self.assertEqual({'$': 'e'}, reduction.columns)
+        self.assertEqual(((3, 6), (2, 5)), (reduction.before, reduction.after))
+        self.assertEqual(len(minimized.actions), reduction.entries[1])
+        self.assertEqual("(S b (A c (A d)))", str(minimized.parse('b c d'.split())))
+        self.assertEqual(['c', 'd'], minimized.expected(minimized.start + 1))
+
+        generator = SentenceGenerator(result.grammar, random.Random(0))
+        for sentence in generator.sentences(50, max_length=10):
+            self.assertTrue(minimized.recognize(sentence))
+            self.assertFalse(minimized.recognize(sentence + ['d']))
+
+        loaded = CompiledTable.from_buffer(minimized.to_bytes())
+        self.assertEqual(minimized.columns, loaded.columns)
+        self.assertEqual(str(minimized.parse('a d'.split())), str(loaded.parse('a d'.split())))
+        loaded.release()
+
+        namespace = {}
+        exec(module_source(minimized), namespace)
+        self.assertTrue(namespace['recognize']('d e'.split()))
+        self.assertFalse(namespace['recognize']('d'.split()))
+
+    def test_ebnf(self):
+        result = parse.build("%ebnf\nS -> a ( ',' a )* | b ( ',' a ( ',' a )* )?")
+        minimized, reduction = minimize(CompiledTable.from_grammar(result.grammar, result.table))
+        self.assertEqual({'S_2': 'S_1'}, reduction.nonterminals)
+        self.assertEqual("(S b , a , a)", str(minimized.parse('b , a , a'.split())))
+
+
+class TestParallel(unittest.TestCase):
+    def test_same_table(self):
+        for case in test_data.examples:
+            g = default_pipeline().run(f.parse_bnf(case))
+            for jobs in (1, 2):
+                table, conflicts = build_table(g, jobs=jobs, collect_all=True)
+                self.assertEqual(g.check_ll1(collect_all=True), conflicts)
+                if table is not None:
+                    expected = CompiledTable.from_grammar(g)
+                    self.assertEqual((expected.symbols, expected.rules, list(expected.actions)),
+                                     (table.symbols, table.rules, list(table.actions)))
+
+    def test_conflicts(self):
+        g = f.parse_bnf(test_data.ambiguous[0])
+        table, conflicts = build_table(g, jobs=1)
+        self.assertIsNone(table)
+        self.assertEqual(g.check_ll1(), conflicts)
+
+    def test_shards(self):
+        self.assertEqual([(0, 2), (2, 3), (3, 5)], shards([1, 1, 2, 1, 1], 3))
+        self.assertEqual([(0, 1)], shards([5], 4))
+        self.assertEqual([(0, 0)], shards([], 2))
+
+
+@unittest.skipUnless(vectorized.np, "NumPy is not installed")
+class TestVectorized(unittest.TestCase):
+    def setUp(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        self.g = result.grammar
+        self.table = CompiledTable.from_grammar(self.g, result.table)
+
+    def assertSameResults(self, table, documents, lanes):
+        accepted, positions = vectorized.VectorRecognizer(table, lanes=lanes).recognize(documents)
+        for document, ok, position in zip(documents, accepted, positions):
+            document = document.split() if isinstance(document, str) else document
+            self.assertEqual(table.recognize(document), ok)
+            try:
+                table.parse(document)
+                self.assertEqual(-1, position)
+            except ParseError as e:
+                self.assertEqual(e.position, position)
+
+    def test_generated(self):
+        rng = random.Random(0)
+        documents = ['', 'id x', 'x', '( id', 'id )']
+        for sentence in SentenceGenerator(self.g, rng).sentences(500, max_length=20):
+            if sentence and rng.random() < 0.5:
+                sentence[rng.randrange(len(sentence))] = rng.choice(['id', '+', '*', '(', ')'])
+            documents.append(sentence)
+        self.assertSameResults(self.table, documents, 64)
+        self.assertSameResults(minimize(self.table)[0], documents, 1000)
+
+    def test_deep_stack(self):
+        table = CompiledTable.from_grammar(f.parse_bnf("S -> a S B B B B B | ε\nB -> ε"))
+        self.assertSameResults(table, ['a ' * 50, 'a ' * 50 + 'b', 'a'], 2)
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        self.g = result.grammar
+        self.parser = IncrementalParser(CompiledTable.from_grammar(self.g, result.table))
+
+    def assertSameTree(self, a, b):
+        self.assertEqual(str(a), str(b))
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            self.assertEqual((a.length, a.width), (b.length, b.width))
+            if not a.is_leaf():
+                stack.extend(zip(a.children, b.children))
+
+    def test_apply_edits(self):
+        text, edit = apply_edits('id + id', [Edit(0, 2, '( id )'), Edit(9, 11, 'x')])
+        self.assertEqual('( id ) + x', text)
+        self.assertEqual(Edit(0, 7, '( id ) + x'), edit)
+        self.assertEqual(text, 'id + id'[:edit.start] + edit.text + 'id + id'[edit.end:])
+
+    def test_random_edits(self):
+        rng = random.Random(1)
+        generator = SentenceGenerator(self.g, rng)
+        pieces = ['', ' ', 'id', ' + ', '*', '(', ')', 'id id', ' ( id ) ', 'i']
+        for sentence in generator.sentences(300, max_length=30):
+            original = ' '.join(sentence) + ' ' * rng.randint(0, 2)
+            text = original
+            edits = []
+            for _ in range(rng.randint(1, 3)):
+                start = rng.randint(0, len(text))
+                edits.append(Edit(start, rng.randint(start, min(len(text), start + 6)), rng.choice(pieces)))
+                text = apply_edits(text, edits[-1:])[0]
+
+            new_text, tree = self.parser.reparse(original, self.parser.parse(original), edits)
+            self.assertEqual(text, new_text)
+            try:
+                self.assertSameTree(self.parser.parse(text), tree)
+            except ParseError:
+                self.assertIsNone(tree)
+
+    def test_local(self):
+        text = ' '.join(['( id + id ) *'] * 2000 + ['id'])
+        tree = self.parser.parse(text)
+        start = text.index('id', len(text) // 2)
+        text, tree = self.parser.reparse(text, tree, [Edit(start, start + 2, 'id * id')])
+        self.assertLess(self.parser.created, 10)
+        self.assertSameTree(self.parser.parse(text), tree)
+
+        text, tree = self.parser.reparse(text, tree, [Edit(0, 1, '')])
+        self.assertIsNone(tree)
+        self.assertIsInstance(self.parser.error, ParseError)
+        text, tree = self.parser.reparse(text, tree, [Edit(0, 0, '(')])
+        self.assertSameTree(self.parser.parse(text), tree)
+
+
+class TestEmit(unittest.TestCase):
+    def test_module(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        table = CompiledTable.from_grammar(result.grammar, result.table)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'expr_table.py')
+            status = parse.run(test_data.unsolved_left_recursion.split('\n') + ['--emit-module', path])
+            self.assertEqual(0, status)
+            with open(path) as f:
+                self.assertNotIn('import', f.read())  # Doesn't need the parser package
+
+            spec = importlib.util.spec_from_file_location('expr_table', path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+        generator = SentenceGenerator(result.grammar, random.Random(0))
+        for sentence in generator.sentences(20, max_length=20):
+            self.assertTrue(module.recognize(sentence))
+            self.assertFalse(module.recognize(sentence + ['+']))
+        self.assertEqual(('F', ['id']), module.parse(['id'])[1][0][1][0])
+        with self.assertRaises(ValueError):
+            module.parse(['id', 'id'])
+
+        loaded = CompiledTable.from_module(module)
+        self.assertEqual(list(table.actions), list(loaded.actions))
+        self.assertEqual(str(table.parse('id * id'.split())), str(loaded.parse('id * id'.split())))
+
+    def test_ebnf(self):
+        result = parse.build("%ebnf\nE -> T ( '+' T )*\nT -> id | '(' E ')'")
+        table = CompiledTable.from_grammar(result.grammar, result.table)
+        namespace = {}
+        exec(module_source(table), namespace)
+        self.assertEqual(('E', [('T', ['id']), '+', ('T', ['(', ('E', [('T', ['id'])]), ')'])]),
+                         namespace['parse']('id + ( id )'.split()))
+        self.assertEqual(table.inline, CompiledTable.from_module(types.SimpleNamespace(**namespace)).inline)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        result = parse.build(test_data.unsolved_left_recursion)
+        self.table = CompiledTable.from_grammar(result.grammar, result.table)
+        generator = SentenceGenerator(result.grammar, random.Random(0))
+        self.documents = [' '.join(s) for s in generator.sentences(300, max_length=20)]
+        self.documents[7] = 'id + + id'
+
+    def test_recognize(self):
+        results, stats = parse_batch(self.table, self.documents, jobs=2, chunksize=16)
+        self.assertEqual([self.table.recognize(d.split()) for d in self.documents], results)
+        self.assertFalse(results[7])
+        self.assertEqual(len(self.documents), stats.documents)
+        self.assertEqual(sum(len(d.split()) for d in self.documents), stats.tokens)
+
+    def test_trees(self):
+        results, stats = parse_batch(self.table, self.documents, trees=True, jobs=2, chunksize=16)
+        self.assertIsNone(results[7])
+        self.assertEqual(str(self.table.parse(self.documents[0].split())), str(results[0]))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.grammars = self.registry.counter('grammars_total', 'Grammars.', ['result'])
+        self.seconds = self.registry.histogram('stage_seconds', 'Stages.', ['stage'], buckets=(0.1, 1))
+
+    def test_expose(self):
+        self.grammars.inc(result='ok')
+        self.grammars.inc(2, result='invalid')
+        self.seconds.observe(0.05, stage='parse_bnf')
+        self.seconds.observe(0.5, stage='parse_bnf')
+        self.seconds.observe(5, stage='parse_bnf')
+        lines = self.registry.expose().splitlines()
+        self.assertIn('# TYPE grammars_total counter', lines)
+        self.assertIn('grammars_total{result="invalid"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse_bnf",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse_bnf",le="1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse_bnf",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_sum{stage="parse_bnf"} 5.55', lines)
+        self.assertIn('stage_seconds_count{stage="parse_bnf"} 3', lines)
+        with self.assertRaises(ValueError):
+            self.grammars.inc(stage='x')
+
+    def test_threads(self):
+        def work():
+            for _ in range(1000):
+                self.grammars.inc(result='ok')
+                self.seconds.observe(0.5, stage='render')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        lines = self.registry.expose().splitlines()
+        self.assertIn('grammars_total{result="ok"} 8000', lines)
+        self.assertIn('stage_seconds_count{stage="render"} 8000', lines)
+
+    def test_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            other = Registry(directory=tmp)
+            counter = other.counter('grammars_total', 'Grammars.', ['result'])
+            counter.inc(3, result='ok')
+            other.write()
+            os.replace(other.path(), other.path('other'))  # As if written by another worker
+
+            registry = Registry(directory=tmp)
+            registry.counter('grammars_total', 'Grammars.', ['result']).inc(result='ok')
+            self.assertIn('grammars_total{result="ok"} 4', registry.expose().splitlines())
+
+    def test_exited_processes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for pid in (2 ** 22 + 1, 2 ** 22 + 2):  # Above the largest pid, so not running
+                other = Registry(directory=tmp)
+                other.counter('grammars_total', 'Grammars.', ['result']).inc(result='ok')
+                other.write()
+                os.replace(other.path(), other.path(pid))
+            registry = Registry(directory=tmp)
+            registry.counter('grammars_total', 'Grammars.', ['result']).inc(result='ok')
+            registry.write()
+
+            for _ in range(2):
+                self.assertIn('grammars_total{result="ok"} 3', registry.expose().splitlines())
+                self.assertEqual(sorted([os.path.basename(registry.path()), os.path.basename(registry.path(EXITED))]),
+                                 sorted(n for n in os.listdir(tmp) if not n.startswith('.')))
+
+    def test_collect_waits_for_prune(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = Registry(directory=tmp)
+            registry.counter('grammars_total', 'Grammars.', ['result']).inc(result='ok')
+            registry.write()
+
+            done = threading.Event()
+            reader = threading.Thread(target=lambda: (registry.collect(), done.set()))
+            with Registry(directory=tmp).locked(fcntl.LOCK_EX):  # As if another process were pruning
+                reader.start()
+                self.assertFalse(done.wait(0.2))
+            reader.join(5)
+            self.assertTrue(done.is_set())
+
+
 class TestComplete(unittest.TestCase):
     def setUp(self):
         self.g = f.parse_bnf(test_data.exam_exercise)
@@ -0,0 +1,119 @@
+/*
+ * Virtualized view of the parsing table.
+ * Only the cells inside the visible area are requested from /table/<key> and rendered.
+ * The header row and the nonterminal column are drawn at the top-left of every window.
+ * If the server no longer has the table (evicted, or computed by another worker), the grammar is sent again
+ * so it computes the table.
+ */
+$(function () {
+  var CELL_WIDTH = 180;
+  var CELL_HEIGHT = 40;
+
+  $('.table-viewport').each(function () {
+    var viewport = $(this);
+    var key = viewport.data('key');
+    var rows = viewport.data('rows');
+    var columns = viewport.data('columns');
+    var win = viewport.find('.table-window');
+    var error = viewport.parent().find('.table-error');
+    var source = {
+      bnf: viewport.attr('data-bnf'),
+      epsilon: viewport.attr('data-epsilon'),
+      eof: viewport.attr('data-eof')
+    };
+    var pending = null;
+    var requested = null;
+    var scheduled = false;
+    var last = null;  // Window drawn
+
+    // One extra row and column for the headers
+    viewport.find('.table-spacer').css({
+      width: (columns + 1) * CELL_WIDTH,
+      height: (rows + 1) * CELL_HEIGHT
+    });
+
+    // Cells are built as DOM nodes, grammar symbols are only ever set as text or attribute values
+    function draw(data) {
+      var head = $('<tr>').append($('<th>'));
+      $.each(data.terminals, function (_, t) {
+        head.append($('<th>').text(t));
+      });
+      var body = $('<tbody>');
+      $.each(data.nonterminals, function (i, nt) {
+        var row = $('<tr>').append($('<th>').text(nt));
+        $.each(data.cells[i], function (_, rules) {
+          var cell = $('<td>').attr('title', rules.join(' | '));
+          $.each(rules, function (j, r) {
+            if (j) {
+              cell.append($('<br>'));
+            }
+            cell.append(document.createTextNode(r));
+          });
+          row.append(cell);
+        });
+        body.append(row);
+      });
+
+      win.empty().append($('<thead>').append(head), body).css({
+        top: data.row * CELL_HEIGHT,
+        left: data.col * CELL_WIDTH
+      });
+    }
+
+    function fetch(query, id, rebuild) {
+      var url = '/table/' + key + '?' + $.param(query);
+      var xhr = rebuild ? $.post(url, source, null, 'json') : $.getJSON(url);
+      pending = xhr;
+      requested = id;
+      xhr.done(function (data) {
+        last = id;
+        error.hide();
+        draw(data);
+      }).fail(function (_, status) {
+        if (status === 'abort') {
+          return;
+        }
+        if (xhr.status === 404 && !rebuild) {
+          fetch(query, id, true);
+          return;
+        }
+        last = null;  // Retried on the next scroll or resize
+        error.text('No se pudo cargar la tabla (' + (xhr.status || status) + ').').show();
+      }).always(function () {
+        if (pending === xhr) {
+          pending = null;
+        }
+      });
+    }
+
+    function update() {
+      scheduled = false;
+      var query = {
+        row: Math.floor(viewport.scrollTop() / CELL_HEIGHT),
+        col: Math.floor(viewport.scrollLeft() / CELL_WIDTH),
+        rows: Math.ceil(viewport.innerHeight() / CELL_HEIGHT),
+        cols: Math.ceil(viewport.innerWidth() / CELL_WIDTH)
+      };
+      var id = $.param(query);
+      if (id === last || (pending && id === requested)) {
+        return;
+      }
+
+      if (pending) {
+        pending.abort();  // Drop windows the user already scrolled past
+      }
+      fetch(query, id, false);
+    }
+
+    function schedule() {
+      if (!scheduled) {
+        scheduled = true;
+        window.requestAnimationFrame(update);
+      }
+    }
+
+    viewport.on('scroll', schedule);
+    $(window).on('resize', schedule);
+    update();
+  });
+});
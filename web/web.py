@@ -1,41 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
 import traceback
+from collections import OrderedDict
 
 from flask import Flask
+from flask import Response
+from flask import abort
+from flask import jsonify
 from flask import render_template
 from flask import request
-from parser.functions import parse_bnf, remove_left_recursion, remove_left_factoring, InvalidGrammar
+from parser.diff import replay
+from parser.functions import parse_bnf, InvalidGrammar
+from parser.metrics import Registry, SIZE_BUCKETS
+from parser.passes import REMOVE_LEFT_FACTORING, REMOVE_LEFT_RECURSION, default_pipeline
+from parser.render import table_terminals, entry_rules
 from parser.rule import InvalidProduction
 
 app = Flask(__name__)
 
+TABLE_CACHE_SIZE = 64
+MAX_WINDOW = 200  # Max rows or columns returned by a single /table request
+
+tables = OrderedDict()
+tables_lock = threading.Lock()
+
+# With several worker processes, set LL1_METRICS_DIR to a directory shared by all of them
+metrics = Registry(directory=os.environ.get('LL1_METRICS_DIR'))
+request_seconds = metrics.histogram('ll1_request_seconds', 'Time to answer a request, by route.', ['route'])
+stage_seconds = metrics.histogram('ll1_stage_seconds', 'Time spent in each stage of the analysis of a grammar.',
+                                  ['stage'])
+grammar_nonterminals = metrics.histogram('ll1_grammar_nonterminals', 'Nonterminals of the submitted grammars.',
+                                         buckets=SIZE_BUCKETS)
+grammar_productions = metrics.histogram('ll1_grammar_productions', 'Productions of the submitted grammars.',
+                                        buckets=SIZE_BUCKETS)
+grammars_total = metrics.counter('ll1_grammars_total', 'Submitted grammars, by result: ok, ambiguous or invalid.',
+                                 ['result'])
+cache_requests = metrics.counter('ll1_cache_requests_total', 'Lookups in the table cache, by use and result.',
+                                 ['cache', 'result'])
+
+STAGE_TITLES = {
+    REMOVE_LEFT_RECURSION.name: 'Gramática sin recursividad por izquierda',
+    REMOVE_LEFT_FACTORING.name: 'Gramática sin factor común por izquierda',
+}
+
+
+def grammar_key(bnf, epsilon, eof):
+    """
+    Key of a submitted grammar in the table cache. Removing left recursion depends on the order of the rules,
+    so the key is a digest of the text as submitted, not the fingerprint of the grammar.
+    :return: hex string
+    """
+    data = json.dumps([bnf, epsilon, eof], ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def store_table(key, g, table, terminals, nonterminals, **results):
+    """
+    Keep a computed parsing table so the results page can fetch it in windows
+    :param key: see grammar_key, to request the table from /table/<key>
+    :param g: the input grammar
+    :param results: other results kept to answer the same grammar again
+    :return: what is kept
+    """
+    entry = dict(results, fingerprint=g.fingerprint, table=table, terminals=terminals, nonterminals=nonterminals)
+    with tables_lock:
+        tables[key] = entry
+        tables.move_to_end(key)
+        while len(tables) > TABLE_CACHE_SIZE:
+            tables.popitem(last=False)
+
+    return entry
+
+
+def cached_table(key, cache):
+    """
+    :param cache: label of the lookup in the cache metrics
+    :return: what store_table kept for key, or None
+    """
+    with tables_lock:
+        entry = tables.get(key)
+        if entry is not None:
+            tables.move_to_end(key)
+    cache_requests.inc(cache=cache, result='miss' if entry is None else 'hit')
+    return entry
+
+
+def matches(entry, g):
+    """
+    :return: True if the pipeline kept in entry starts from grammar g, so its changes can be replayed on it
+    """
+    changes = entry['changes']
+    return entry['fingerprint'] == g.fingerprint and (
+        not changes or changes[0][1].before == (g.start, tuple(g.nonterminals)))
+
+
+def analyze(key, g):
+    """
+    Run the pipeline and compute the parsing table of g, and keep them in the cache
+    :return: what store_table kept
+    """
+    pipeline = default_pipeline(record_changes=True)
+    grammar_not_factor = pipeline.run(g)
+    changes = [(name, diff) for (name, _), diff in zip(pipeline.timings, pipeline.changes)]
+    for name, seconds in pipeline.timings:
+        stage_seconds.observe(seconds, stage=name)
+    with stage_seconds.time(stage='parsing_table'):
+        table, ambiguous = grammar_not_factor.parsing_table()
+    app.logger.debug('Pass timings:\n%s', pipeline.report())
+
+    return store_table(key, g, table, table_terminals(grammar_not_factor), list(grammar_not_factor.nonterminals),
+                       changes=changes, no_factor=grammar_not_factor, ambiguous=ambiguous)
+
+
+def window_arg(name, default, limit):
+    value = request.args.get(name, default, type=int)
+    return max(0, min(value, limit))
+
 
 def just_do_it(req):
     errors = []
     g = None
-    grammar_not_recursive = None
+    stages = []
     grammar_not_factor = None
     parsing_table = None
 
     try:
-        g = parse_bnf(req.form['bnf'], epsilon=req.form['epsilon'], eof=req.form['eof'])
-        grammar_not_recursive = remove_left_recursion(g)
-        grammar_not_factor = remove_left_factoring(grammar_not_recursive)
-        table, ambiguous = grammar_not_factor.parsing_table()
+        source = {'bnf': req.form['bnf'], 'epsilon': req.form['epsilon'], 'eof': req.form['eof']}
+        with stage_seconds.time(stage='parse_bnf'):
+            g = parse_bnf(source['bnf'], epsilon=source['epsilon'], eof=source['eof'])
+        grammar_nonterminals.observe(len(g.nonterminals))
+        grammar_productions.observe(sum(1 for _ in g.iter_productions()))
+
+        key = grammar_key(**source)
+        entry = cached_table(key, 'results')
+        if entry is None or not matches(entry, g):
+            entry = analyze(key, g)
+        table, ambiguous = entry['table'], entry['ambiguous']
+        terminals, nonterminals = entry['terminals'], entry['nonterminals']
+        changes, grammar_not_factor = entry['changes'], entry['no_factor']
+
+        # Intermediate grammars are rebuilt from the input one while the page is rendered
+        stages = zip([STAGE_TITLES.get(name, name) for name, _ in changes], replay(g, [d for _, d in changes]))
 
         if ambiguous:
             errors.append('El lenguaje de entrada no es LL(1) debido a que se encontraron ambigüedades.')
+        grammars_total.inc(result='ambiguous' if ambiguous else 'ok')
 
-        parsing_table = {'table': table,
-                         'terminals': sorted(set(g.terminals) - {g.epsilon}) + [g.eof],
-                         'nonterminals': [nt for nt in grammar_not_factor.nonterminals]}
+        parsing_table = {'key': key,
+                         'source': source,
+                         'rows': len(nonterminals),
+                         'columns': len(terminals),
+                         'entries': len(table),
+                         'conflicts': sum(1 for e in table.values() if isinstance(e, list))}
 
     except InvalidGrammar:
         errors.append('Gramática inválida. Revise las especificaciones de BNF.')
+        grammars_total.inc(result='invalid')
     except InvalidProduction as e:
         errors.append('Produccion invalida: {}.'.format(e.production))
+        grammars_total.inc(result='invalid')
+
+    with stage_seconds.time(stage='render'):
+        return render_template('results.html', grammar=g, stages=stages, no_factor=grammar_not_factor,
+                               parsing_table=parsing_table, errors=errors)
+
+
+@app.before_request
+def start_timer():
+    request.environ['ll1.start'] = time.perf_counter()
 
-    return render_template('results.html', grammar=g, no_recursion=grammar_not_recursive, no_factor=grammar_not_factor,
-                           parsing_table=parsing_table, errors=errors)
+
+@app.after_request
+def record_latency(response):
+    start = request.environ.get('ll1.start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'not-found'
+        request_seconds.observe(time.perf_counter() - start, route=route)
+    return response
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -46,6 +190,48 @@ def index():
         return just_do_it(request)
 
 
+@app.route('/table/<key>', methods=['GET', 'POST'])
+def table_window(key):
+    """
+    Return a window of a parsing table computed by a previous POST to /.
+    Query arguments row, col give the first row and column, rows, cols the window size.
+    If the table isn't in the cache of this process, a POST with the fields of the grammar (bnf, epsilon, eof)
+    computes it again, a GET gets a 404.
+    """
+    entry = cached_table(key, 'table-window')
+    if entry is None and request.method == 'POST':
+        source = {name: request.form.get(name, '') for name in ('bnf', 'epsilon', 'eof')}
+        if grammar_key(**source) != key:
+            abort(400)
+        try:
+            g = parse_bnf(source['bnf'], epsilon=source['epsilon'], eof=source['eof'])
+        except (InvalidGrammar, InvalidProduction):
+            abort(400)
+        entry = analyze(key, g)
+    if entry is None:
+        abort(404)
+
+    nonterminals = entry['nonterminals']
+    terminals = entry['terminals']
+    row = window_arg('row', 0, len(nonterminals))
+    col = window_arg('col', 0, len(terminals))
+    rows = nonterminals[row:row + window_arg('rows', 50, MAX_WINDOW)]
+    columns = terminals[col:col + window_arg('cols', 20, MAX_WINDOW)]
+
+    table = entry['table']
+    cells = [[[str(r) for r in entry_rules(table.get((nt, t)))] for t in columns] for nt in rows]
+
+    return jsonify(row=row, col=col, nonterminals=rows, terminals=columns, cells=cells)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Metrics in the Prometheus text format
+    """
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/about')
 def about():
     return render_template('about.html')